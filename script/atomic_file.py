@@ -0,0 +1,40 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Atomic writes of the files of a run (tagged files, stage cache, stats, metrics): a file is written under a
+# temporary name ("PATH.PID.tmp") and renamed once it is complete, so that an interrupted run, or a process
+# reading the file at the same time (e.g. a metrics scraper), never sees a partly written file.
+# -----------------------------------------------------------
+
+import contextlib
+import os
+
+import compression
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode="w", compress=None):
+    """
+    Opens a file to write under a temporary name, and renames it to path at the end of the with block ; if the
+    block raises an exception, the temporary file is removed and path is left as it was.
+    :param path: the path to the file
+    :param mode: "w" for a text file, "wb" for a binary file
+    :param compress: None, or the compression of a binary file ("gzip" or "zstd", see compression.open_file())
+    :return: a context manager giving the file object
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if mode == "wb":
+            with compression.open_file(temporary_path, mode, compress) as temporary_file:
+                yield temporary_file
+        else:
+            with open(temporary_path, mode) as temporary_file:
+                yield temporary_file
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, path)
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Index of the sales by author, built by extractor_xml.py (--author-index) and stored in a sqlite file.
+# Each item of a catalogue is a row: (author surname, catalogue, xml:id, sell date, price, term, format),
+# indexed by surname for exact and prefix lookups and by catalogue for the updates.
+# Usage : python3 author_index.py ../output/authors.sqlite Cherubini [--prefix]
+# -----------------------------------------------------------
+
+import argparse
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales (
+    author TEXT NOT NULL,
+    catalogue TEXT NOT NULL,
+    id TEXT NOT NULL,
+    sell_date TEXT,
+    price REAL,
+    term TEXT,
+    format TEXT
+);
+CREATE INDEX IF NOT EXISTS sales_author ON sales (author);
+CREATE INDEX IF NOT EXISTS sales_catalogue ON sales (catalogue);
+"""
+
+COLUMNS = "author, catalogue, id, sell_date, price, term, format"
+
+
+def connect(path):
+    """
+    Opens the index, and creates it if needed.
+    :param path: the path to the sqlite file
+    :return: a sqlite3 connection
+    """
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def normalise_surname(author):
+    """
+    :param author: the surname extracted by desc_extractor() (e.g. "Cherubini,")
+    :return: the surname without the surrounding punctuation
+    """
+    return author.strip(" ,.;:")
+
+
+def update_catalogue(connection, catalogue, output_dict):
+    """
+    Replaces the rows of a catalogue with the items of output_dict. The items without author are not indexed.
+    :param connection: the connection to the index
+    :param catalogue: the name of the catalogue ("CAT_XXXXXX")
+    :param output_dict: the data extracted from the catalogue, by xml:id (see extractor_xml.tag_file())
+    """
+    rows = []
+    for id, values in output_dict.items():
+        if values["author"] is None or normalise_surname(values["author"]) == "":
+            continue
+        rows.append((normalise_surname(values["author"]), catalogue, id, values["sell_date"], values["price"],
+                     values["term"], values["format"]))
+    with connection:
+        connection.execute("DELETE FROM sales WHERE catalogue = ?", (catalogue,))
+        connection.executemany(f"INSERT INTO sales ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def lookup(connection, surname):
+    """
+    :param connection: the connection to the index
+    :param surname: the surname of an author
+    :return: the list of the (author, catalogue, id, sell_date, price, term, format) rows of this author
+    """
+    return connection.execute(f"SELECT {COLUMNS} FROM sales WHERE author = ? ORDER BY catalogue, id",
+                              (surname,)).fetchall()
+
+
+def prefix_lookup(connection, prefix):
+    """
+    :param connection: the connection to the index
+    :param prefix: the beginning of a surname
+    :return: the list of the (author, catalogue, id, sell_date, price, term, format) rows of the authors
+    whose surname starts with prefix
+    """
+    # A range on the indexed column, instead of LIKE, so that the index is used.
+    return connection.execute(f"SELECT {COLUMNS} FROM sales WHERE author >= ? AND author < ? "
+                              f"ORDER BY author, catalogue, id", (prefix, prefix + "\U0010ffff")).fetchall()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("index", help="path to the sqlite file built with extractor_xml.py --author-index")
+    arg_parser.add_argument("surname", help="surname of the author")
+    arg_parser.add_argument("--prefix", action="store_true", help="search the surnames starting with surname")
+    args = arg_parser.parse_args()
+
+    index_connection = connect(args.index)
+    if args.prefix:
+        results = prefix_lookup(index_connection, args.surname)
+    else:
+        results = lookup(index_connection, args.surname)
+    for row in results:
+        print("\t".join("" if value is None else str(value) for value in row))
+    print(f"{len(results)} items")
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Benchmark of the length extraction: compares the throughput (descs/sec) of the current
+# length_extractor() with the previous implementation, kept below as legacy_length_extractor(),
+# and checks that both produce the same results.
+# Usage : python3 benchmark_length.py ../1-100 [../101-200 ...] [--repeat N]
+# -----------------------------------------------------------
+
+import argparse
+import copy
+import glob
+import os
+import re
+import time
+
+import extractor_xml
+import tables.conversion_tables
+
+
+# ----- PREVIOUS IMPLEMENTATION ----- #
+def legacy_length_extractor(descList, input_dict):
+    """
+    length_extractor() before the single search rewrite: the pattern is searched three times per desc and
+    the values are converted with is_roman() and isInt(), which use exceptions.
+    """
+    length_pattern = re.compile(r"([IVXivx0-9\/]{1,6})\.?\s(pages|page|pag.|p.)\s([0-5\/]{0,3})")
+    pattern_fraction = re.compile(r"([0-9\/]{1,6})\s?de\s?p[ages]{0,3}\.?")
+    for item in descList:
+        desc, id = item[0], item[1]
+        desc = extractor_xml.clean_text(desc)
+        desc = re.sub(r"\s+", " ", desc)
+        desc = desc.replace("p/", "p")
+        dict_values = input_dict[id]
+        length = None
+        if re.search(length_pattern, desc):
+            position_chaine = re.search(length_pattern, desc).span()
+            pn_search = re.search(length_pattern, desc)
+            first_group = pn_search.group(1)
+            second_group = pn_search.group(3)
+            if second_group == "":
+                if first_group != "":
+                    if isInt(is_roman(first_group.upper())):
+                        length = int(is_roman(first_group.upper()))
+                    else:
+                        try:
+                            length = tables.conversion_tables.fractions_to_float[first_group]
+                        except:
+                            length = f'key error, please check the transcription: {first_group}'
+            elif first_group != "" and second_group != "":
+                if isInt(first_group):
+                    value_1 = int(first_group)
+                else:
+                    value_1 = is_roman(first_group.upper())
+                    if isInt(value_1):
+                        pass
+                    else:
+                        try:
+                            value_1 = tables.conversion_tables.fractions_to_float[value_1]
+                        except:
+                            value_1 = 501
+                if isInt(second_group):
+                    value_2 = int(second_group)
+                else:
+                    try:
+                        value_2 = tables.conversion_tables.fractions_to_float[second_group]
+                    except:
+                        value_2 = 404
+                length = float(value_1) + float(value_2)
+            else:
+                length = None
+        elif re.search(pattern_fraction, desc):
+            search = re.search(r"([0-9\/]{1,6})\s?de\s?p[age]{0,3}\.?", desc)
+            position_chaine = search.span()
+            try:
+                length = tables.conversion_tables.fractions_to_float[search.group(1)]
+            except:
+                length = 0
+
+        if length != None:
+            starting_position = position_chaine[0]
+            ending_position = position_chaine[1]
+            if desc[ending_position - 1] == " ":
+                ending_position = ending_position - 1
+            desc_xml = f'{desc[:starting_position]}<measure xmlns="http://www.tei-c.org/ns/1.0"' \
+                       f' type="length" unit="p" n="{length}">' \
+                       f'{desc[starting_position:ending_position]}</measure>{desc[ending_position:]}'
+        else:
+            desc_xml = desc
+        dict_values["number_of_pages"] = length
+        input_dict[id] = dict_values
+        item[0] = desc_xml
+    return input_dict
+
+
+def isInt(string):
+    try:
+        int(string)
+        result = isinstance(int(string), int)
+    except:
+        result = False
+    return result
+
+
+def is_roman(value):
+    try:
+        value in tables.conversion_tables.roman_to_arabic.keys()
+        value = tables.conversion_tables.roman_to_arabic[value]
+        return value
+    except:
+        return value
+
+
+# ----- BENCHMARK ----- #
+def load_descs(input_dirs):
+    """
+    :return: the descList of all the catalogues of the input directories, as seen by the length extraction
+    """
+    descList = []
+    for input_dir in input_dirs:
+        for xml_file in sorted(glob.glob(os.path.join(input_dir, "*_clean.xml"))):
+            descList.extend(extractor_xml.desc_extractor(xml_file))
+    extractor_xml.price_extractor(descList)
+    return descList
+
+
+def time_extractor(extractor, descList, repeat):
+    """
+    Runs an extractor `repeat` times on copies of descList.
+    :return: the best time in seconds, and the output of the last run
+    """
+    best = None
+    for _ in range(repeat):
+        descs = copy.deepcopy(descList)
+        input_dict = {item[1]: {} for item in descs}
+        start = time.perf_counter()
+        extractor(descs, input_dict)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, [(item[0], input_dict[item[1]]["number_of_pages"]) for item in descs]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("input", nargs="+", help="input directories")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="number of runs (the best one is kept)")
+    args = arg_parser.parse_args()
+
+    descList = load_descs(args.input)
+    print(f"{len(descList)} descs")
+    legacy_time, legacy_results = time_extractor(legacy_length_extractor, descList, args.repeat)
+    current_time, current_results = time_extractor(extractor_xml.length_extractor, descList, args.repeat)
+    differences = sum(1 for legacy, current in zip(legacy_results, current_results) if legacy != current)
+    print(f"before : {len(descList) / legacy_time:,.0f} descs/sec")
+    print(f"after  : {len(descList) / current_time:,.0f} descs/sec (x{legacy_time / current_time:.2f})")
+    print(f"{differences} different results")
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Compressed catalogue files: the input files can be "*_clean.xml", "*_clean.xml.gz" or "*_clean.xml.zst",
+# and the tagged files can be written compressed (--compress gzip or zstd).
+# The files are read and written through streaming (de)compressors: a catalogue is never held in memory
+# both compressed and uncompressed.
+# The gzip files are written without a name or a modification time in their header, so that the same
+# catalogue always gives the same bytes. zstd needs the zstandard library (pip install zstandard).
+# -----------------------------------------------------------
+
+import contextlib
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The suffix of the files of each compression.
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# The patterns of the input files.
+INPUT_PATTERNS = ["*_clean.xml"] + [f"*_clean.xml{suffix}" for suffix in SUFFIXES.values()]
+
+
+def compression_of(path):
+    """
+    :param path: the path to a file
+    :return: the compression of the file ("gzip" or "zstd"), from its suffix ; None if it is not compressed
+    """
+    for compression, suffix in SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_suffix(path):
+    """
+    :param path: the path to a file, compressed or not
+    :return: the path without the suffix of the compression ("CAT_000001_clean.xml.gz" -> "CAT_000001_clean.xml")
+    """
+    compression = compression_of(path)
+    return path[:-len(SUFFIXES[compression])] if compression is not None else path
+
+
+def check_available(compression):
+    """
+    :param compression: None, "gzip" or "zstd"
+    :raise RuntimeError: if the library needed by the compression is not installed
+    """
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd compression needs the zstandard library (pip install zstandard)")
+
+
+@contextlib.contextmanager
+def open_file(path, mode, compression=None):
+    """
+    Opens a file in binary mode, through a streaming (de)compressor if needed.
+    :param path: the path to the file
+    :param mode: "rb" or "wb"
+    :param compression: the compression of a file to write (None, "gzip" or "zstd") ; a file to read is
+    decompressed according to its suffix
+    :return: a context manager giving a binary file object
+    """
+    if mode == "rb":
+        compression = compression_of(path)
+    check_available(compression)
+    with open(path, mode) as raw_file:
+        if compression == "gzip":
+            with gzip.GzipFile(filename="", mode=mode, compresslevel=6, fileobj=raw_file, mtime=0) as gzip_file:
+                yield gzip_file
+        elif compression == "zstd":
+            with zstandard.open(raw_file, mode) as zstd_file:
+                yield zstd_file
+        else:
+            yield raw_file
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Cost model of a run of extractor_xml.py.
+# After each run, the cost of each catalogue (size, number of descs, number of date strings parsed with
+# the dateparser library, CPU seconds) is recorded in a small JSON stats file (output/run_stats.json).
+# The next runs use it to:
+# - predict the cost of each file: the recorded seconds (scaled if the size of the file changed), or the
+#   average seconds per byte of the recorded files for a new file ; the cost is not proportional to the size,
+#   it mostly depends on the number of dates that go through dateparser
+# - order the queue, most expensive files first
+# - choose the number of workers: more workers than (total cost / cost of the most expensive file) cannot
+#   finish sooner, and they are never more than the CPUs available to the process
+# - predict the runtime, which is printed with the actual runtime at the end of the run
+# -----------------------------------------------------------
+
+import heapq
+import json
+import math
+import os
+
+import atomic_file
+
+# The seconds needed to start a worker (the imports, and the loading of the languages of dateparser, see
+# extractor_xml.warm_up_dateparser()): a run shorter than this is not parallelized.
+WORKER_STARTUP = 3.0
+
+
+def available_cpus():
+    """
+    :return: the number of CPUs this process may run on (which can be less than os.cpu_count() on shared runners)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def load_stats(path):
+    """
+    :param path: the path to the stats file
+    :return: a dict with the names of the catalogues as keys, and their cost as values ; empty if there is no
+    (readable) stats file
+    """
+    try:
+        with open(path, "r") as stats_file:
+            return json.load(stats_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_stats(path, stats):
+    """
+    Writes the stats file (see atomic_file.py).
+    """
+    with atomic_file.atomic_open(path) as stats_file:
+        json.dump(stats, stats_file, indent=1, sort_keys=True)
+
+
+def predict(stats, sizes):
+    """
+    Predicts the cost of each file.
+    :param stats: the recorded costs (see load_stats())
+    :param sizes: a dict with the names of the catalogues as keys, and the sizes of the files as values
+    :return: a (predictions, known) tuple: predictions is a dict with the names of the catalogues as keys, and the
+    predicted seconds as values ; known is False if there are no stats at all, the predictions being then the
+    sizes of the files (which only makes sense to order them)
+    """
+    recorded = [cost for cost in stats.values() if cost["size"] > 0]
+    if not recorded:
+        return dict(sizes), False
+    seconds_per_byte = sum(cost["seconds"] for cost in recorded) / sum(cost["size"] for cost in recorded)
+    predictions = {}
+    for name, size in sizes.items():
+        cost = stats.get(name)
+        if cost is not None and cost["size"] > 0:
+            predictions[name] = cost["seconds"] * size / cost["size"]
+        else:
+            predictions[name] = seconds_per_byte * size
+    return predictions, True
+
+
+def choose_workers(costs, cpus):
+    """
+    :param costs: the predicted costs of the files
+    :param cpus: the number of CPUs available
+    :return: the number of workers to use
+    """
+    if not costs or sum(costs) < WORKER_STARTUP:
+        return 1
+    useful = math.ceil(sum(costs) / max(costs)) if max(costs) > 0 else len(costs)
+    return max(1, min(cpus, len(costs), useful))
+
+
+def predicted_runtime(costs, workers, cpus):
+    """
+    Simulates the queue: each file, in order, goes to the first worker available.
+    :param costs: the predicted costs of the files, in the order of the queue
+    :param workers: the number of workers
+    :param cpus: the number of CPUs available (the workers share them if they are more)
+    :return: the predicted runtime in seconds, including the start of the workers
+    """
+    loads = [0.0] * workers
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return WORKER_STARTUP + max(max(loads), sum(costs) / min(workers, cpus))
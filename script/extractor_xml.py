@@ -5,11 +5,12 @@
 #  Katabase project: github.com/katabase/
 # Python script to create XML files with normalised <desc> out of cleaned XML
 # produced in the previous step (1_OutputData)
-# Input : a directory containing XML files with names following the pattern 'CAT_\d+_clean.xml'
+# Input : a directory containing XML files with names following the pattern 'CAT_\d+_clean.xml', compressed or not
+# ('CAT_\d+_clean.xml.gz' or 'CAT_\d+_clean.xml.zst', see compression.py)
 #
 # * FULL PROCESS BREAKDOWN *
-# - conversion_to_list() extracts the <desc>s of the input XML files and stores them in a list
-#   containing nested lists (a list for all the descs in an XML file -> a list for each desc)
+# - desc_extractor() extracts the <desc>s of an input XML file and stores them in a list containing nested
+#   lists (a list for all the descs of the file -> a list for each desc)
 # - price_extractor() extracts all prices and stores them in an output_dict ; this dict will be
 #   updated in the following steps to contain all important items in the <desc>
 # - date_extractor() extracts all dates, stores them in an XML <date> and updates output_dict with
@@ -22,61 +23,73 @@
 #   with this data
 # - xml_output_production() replaces the input XMLs' descs with a new, normalised <desc> using elements
 #   of output_dict()
-# - if __name__ == "__main__" initates a command line interface that takes the input directory as
-#   parameter, creates output directories and runs all the steps above in order to create the new XML files
+# - run_extractors() runs the extractors above in order (see stages, the registry of the extractors) ; only some
+#   of them can be run, the results of the others being taken from a cache (see stage_cache.py) ; when an error
+#   log is given, an item on which an extractor fails is passed through untagged and the error is recorded,
+#   instead of stopping the run
+# - tag_descs() is the library entry point: it runs the extractors above on an iterable of descs
+#   (strings or records) and yields the results in batches, without reading or writing any file
+# - if __name__ == "__main__" initates a command line interface that takes the input directories as
+#   parameter, creates output directories and runs all the steps above on each file (with a pool of
+#   processes, biggest files first) in order to create the new XML files ; the errors are written in
+#   output/errors.jsonl and do not stop the run ; the progress of the files and of each stage is shown
+#   with progress bars (see progress.py) ; each file done is recorded in a journal (output/journals), so that
+#   an interrupted run can be resumed with --resume (see journal.py)
 # -----------------------------------------------------------
 
 
-import shutil
 import os
 import sys
 import glob
+import hashlib
 import re
 import logging
 import traceback
+import json
+import copy
+import datetime
+import functools
 import dateparser
 import tables.rep_greg_conversion
+import tables.calendar_array
 import tables.conversion_tables
+import author_index
+import search_index
+import progress
+import journal
+import stage_cache
+import cost_model
+import run_logging
+import compression
+import atomic_file
+import validation
+import metrics
 import argparse
+import collections
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from lxml import etree
 from pathlib import Path
 from xml.etree import ElementTree
 
 # UNUSED IMPORTS
-# import datetime
 # from decimal import *
 # from dateparser.search import search_dates
 # import xml.etree.ElementTree as ET
 
-# log errors in a .log file
-logging.basicConfig(filename='errors.log', level=logging.DEBUG, filemode="w",
-                    format="%(levelname)-8s [%(filename)s:%(lineno)d] %(message)s")
-
 tei = {'tei': 'http://www.tei-c.org/ns/1.0'}
 
 
 # ----- MAIN FUNCTIONS ----- #
-def conversion_to_list(path):
-    """
-    This function creates a global list gathering all tei:desc from the xml files.
-    :param path:date
-    :return: a list
-    """
-    final_list = []
-    for xml_file in glob.iglob(path):
-        file = xml_file
-        for desc_element in desc_extractor(xml_file):
-            final_list.append(desc_element)
-    return final_list, file
-
-
 def desc_extractor(input):
     """
     This function extracts from the xml files all of the tei:desc elements and returns them as nested lists
     (a list for all the descs in an XML file -> a list for each desc).
     :return: a list of lists that contains the tei:desc value, the date of the sale,
     """
-    with open(input, 'r+') as fichier:
+    with compression.open_file(input, "rb") as fichier:
         f = etree.parse(fichier)
         root = f.getroot()
         desc = root.xpath("//tei:desc", namespaces=tei)
@@ -114,7 +127,6 @@ def price_extractor(descList):
     :param descList: the list containing all of the tei:desc
     :return: a dict with the ids as keys, and value another dict with the prices
     """
-    print("Extracting price information")
     output_dict = {}
     for item in descList:
         desc, id = item[0], item[1]
@@ -148,162 +160,309 @@ def price_extractor(descList):
     return (output_dict)
 
 
+# Prefilter: a desc without any of these keywords cannot match the date patterns below (a gregorian year
+# contains a "1", a republican year is preceded by " an ").
+date_keywords = ("1", " an ")
+# We search for any series of four digits (as a gregorian date)
+loose_gregorian_calendar_pattern = re.compile(".*(1[0-9][0-9][0-9]).*")
+# We search for any hint of the republication calendar (as "an" and roman numerals)
+republican_calendar_pattern = re.compile(".*\san ([XIVxiv]{1,4}|[0-9]{1,2}).*")
+# This pattern matches strings that contains only a year.
+gregorian_year_pattern = re.compile("^1[0-9][0-9][0-9]$")
+year_pattern = re.compile("(1[0-9][0-9][0-9])")
+
+
+def gregorian_date_string(desc):
+    """
+    Reduces a desc containing a gregorian year to the string containing the date, by tokenizing it into smaller and
+    smaller chunks.
+    Example: "Pièce de vers aut. sig. sig. aussi par sa femme Caroline Vanhove: 18 janvier 1798, 1 p. in-8 obl. 22"
+    :param desc: the cleaned desc
+    :return: a (unprocessed_date_string, date) tuple: the string to tag in the desc, and the cleaned date string
+    """
+    """First, we start reducing the string with a first split using the comma as delimiter, as (usually) there
+    is no comma in a date:
+    ['Pièce de vers aut. sig. sig. aussi par sa femme Caroline Vanhove: 18 janvier 1798', ' 1 p. in-8 obl. 22']"""
+    tokenizedDesc = desc.split(",")
+    string_list = []
+    for tok_item in tokenizedDesc:
+        if loose_gregorian_calendar_pattern.match(tok_item):
+            string_list.append(tok_item)
+    """We can reduce the list to its last element: it will contain the date, as (usually) there is only a
+    single date:
+    ['Pièce de vers aut. sig. sig. aussi par sa femme Caroline Vanhove: 18 janvier 1798']"""
+    string_list = string_list[-1]
+
+    # Second, we can reduce the string using the semi colon as delimiter.
+    # In our example, it won't affect the string.
+    string_list = string_list.split(";")
+    for elem in string_list:
+        if loose_gregorian_calendar_pattern.match(elem):
+            string_list = elem
+    # We split the string by the date, keeping it. The year beeing the delimiter, everything after it is not
+    # a date. No change in our example
+    string_list = year_pattern.split(string_list)
+    string_list = string_list[:-1]
+    date_string = ''.join([str(elem) for elem in string_list])
+    # Strip is used to remove leading and trailing spaces.
+    unprocessed_date_string = date_string.strip()
+
+    # Third, we reduce the string using the colon as delimiter.
+    # '18 janvier 1798'
+    date_string = date_string.split(":")
+    for elem in date_string:
+        if loose_gregorian_calendar_pattern.match(elem):
+            date_string = elem
+    # Etc.
+    date_string = date_string.split("(")
+    for elem in date_string:
+        if loose_gregorian_calendar_pattern.match(elem):
+            date_string = elem
+
+    date_string = date_string.split("«")
+    for elem in date_string:
+        if loose_gregorian_calendar_pattern.match(elem):
+            date_string = elem
+
+    date_string = date_string.split(">")
+    for elem in date_string:
+        if loose_gregorian_calendar_pattern.match(elem):
+            date_string = elem
+
+    # Then we clean the string
+    date_string = re.sub(r'\s+', ' ', date_string)
+    date_string = re.sub(r'\(', '', date_string)
+    date_string = re.sub(r'L\. a\. s\.', '', date_string)
+    # And eventually we can extract the date as a string to process it
+    date = re.sub(r'^\s', '', date_string)
+    return unprocessed_date_string, date
+
+
+# The most frequent date strings: "18 janvier 1798", "1er oct. 1386", "mars 1817"...
+native_date_pattern = re.compile(r"^(?:(1er|[0-9]{1,2}) )?(%s)\.? (1[0-9]{3})$" % "|".join(
+    sorted(tables.conversion_tables.french_months, key=len, reverse=True)), re.IGNORECASE)
+
+
+def native_date(date):
+    """
+    Normalises the most frequent date strings without the dateparser library, with the same results (except
+    for "1er sept.", which dateparser reads as the 1st of July).
+    :param date: the date string, as returned by gregorian_date_string()
+    :return: the normalised date ("YYYY-MM-DD" or "YYYY-MM"), or None if the string is not recognized
+    """
+    date_match = native_date_pattern.match(date)
+    if date_match is None:
+        return None
+    day, month, year = date_match.groups()
+    month = tables.conversion_tables.french_months[month.lower()]
+    if day is None:
+        return f"{year}-{month:02d}"
+    day = 1 if day == "1er" else int(day)
+    try:
+        return datetime.date(int(year), month, day).isoformat()
+    except ValueError:
+        # an impossible date is left to dateparser
+        return None
+
+
+# The metrics of this process, updated by the extractors (see metrics.py): the costs of the files (see tag_task())
+# are computed from them, and they are merged in the main process at the end of each file.
+process_metrics = metrics.Metrics()
+# The number of normalised date strings kept by each process (see parse_date_string()): the most recent strings
+# are kept, so that the memory of a long-lived process (--watch, tag_descs()) does not grow with the corpus.
+date_cache_size = 8192
+
+
+@functools.lru_cache(maxsize=date_cache_size)
+def parse_date_string(date):
+    """
+    Normalises a date string that is not a simple year: the most frequent forms are recognized by native_date(),
+    the others are parsed with the dateparser library.
+    The results of the last date_cache_size strings are kept, so that the strings shared by several catalogues
+    are not parsed again. The metrics are counted by date_extractor(), for each catalogue, so that they do not
+    depend on the catalogues tagged before by the process.
+    see https://dateparser.readthedocs.io/en/v0.2.1/_modules/dateparser/date.html
+    :param date: the date string, as returned by gregorian_date_string()
+    :return: a (normalised date, date_log_path, parser) tuple, parser being "native" or "dateparser"
+    """
+    normalised_date = native_date(date)
+    if normalised_date is not None:
+        return normalised_date, 5, "native"
+    # A new parser is used for each string: a parser reuses the languages of the previous strings.
+    parsed_date = dateparser.date.DateDataParser().get_date_data(u'%s' % date)
+    # if it doesn't work, we select the YYYY string.
+    if parsed_date["date_obj"] is None:
+        return year_pattern.search(date).group(0), 4, "dateparser"
+    # We get the precision of the date: dateparser will autocomplete
+    # the date using the current date if it has only the month. That is not what we want.
+    if parsed_date["period"] == "month":
+        return parsed_date["date_obj"].strftime('%Y-%m'), 5, "dateparser"
+    # This statement should never be true.
+    elif parsed_date["period"] == "year":
+        return parsed_date["date_obj"].strftime('%Y'), 5, "dateparser"
+    else:
+        return parsed_date["date_obj"].strftime('%Y-%m-%d'), 5, "dateparser"
+
+
+def warm_up_dateparser():
+    """
+    Loads the languages of dateparser, which it does the first time that it parses a string (about 2.5 CPU seconds
+    when the language of the string is not recognized at once): a process calls this before its first file, so
+    that the cost of the first file that reaches dateparser does not include it (see cost_model.py).
+    The strings are not parsed with parse_date_string(), so that they are not kept in its cache.
+    """
+    for date in ("12 mai 1836", "vers 1790 environ"):
+        dateparser.date.DateDataParser().get_date_data(date)
+
+
+# The paths of the dates in the metrics, by date_log_path (see date_extractor()).
+date_paths = {2: "year", 6: "republican", None: "none"}
+
+
 def date_extractor(descList, input_dict):
     """
     Extracts the dates from the list containing all of the tei:desc, and update the main dict.
 
     *COMPLETE BREAKDOWN OF THE PROCESS*
-    - loop over every item of descList (a list containing all the <desc>s of the processed xml file
+    - loop over every item of descList (a list containing all the <desc>s of the processed xml file)
+      to extract the candidate date strings
       - if the date is in gregorian format (YYYY-MM-DD...), extract the date
         - try to extract it "by hand" using regexes and tokenizing the string containing the date
           into smaller and smaller chunk until a date in format YYYY is obtained
-        - if that fails, use the dateparser library to extract a date
-        - save the date in a <date> XML element
+        - if that fails, the string will be parsed with the dateparser library
       - if the date is french republican format ("An \d{1}"), convert it into a gregorian format
-        and save it in a <date>
-    - update input_dict with the normalized date in a XML <date>
+    - normalise each distinct date string of the catalogue once (with a native grammar for the most frequent
+      forms, with the dateparser library otherwise, see parse_date_string(), which also keeps the recent strings
+      of the previous catalogues): the number of calls depends on the number of different strings, not on the
+      number of descs
+    - save the dates in <date> XML elements and update input_dict with the normalized dates
 
     :param descList: the list containing all of the tei:desc
     :param input_dict: the dictionnary containing the data previously extracted (at this moment, only the price)
     :return: a dict which keys are the ids, and which values are another dict with prices and dates
     """
-    print("Extracting date information")
+    # First, the candidate date strings of all the descs.
+    candidates = []
+    # the positions of the full republican dates in candidates, with their (year, month, day) numbers
+    republican = []
+    skipped = 0
     for item in descList:
-        desc, id = item[0], item[1]
-        desc = clean_text(desc)
-        # We search for any series of four digits (as a gregorian date)
-        loose_gregorian_calendar_pattern = re.compile(
-            ".*(1[0-9][0-9][0-9]).*")
-        # We search for any hint of the republication calendar (as "an" and roman numerals)
-        republican_calendar_pattern = re.compile(
-            ".*\san ([XIVxiv]{1,4}|[0-9]{1,2}).*")
-
-        dict_values = input_dict[id]
-        date_log_path = None
-        date_range = None
-        desc_xml = desc
-
+        desc = clean_text(item[0])
+        if not contains_any(desc, date_keywords):
+            skipped += 1
+            candidates.append((desc, None, None, None))
         # Let's extract the gregorian calendar dates.
-        # Example: "Pièce de vers aut. sig. sig. aussi par sa femme Caroline Vanhove: 18 janvier 1798, 1 p. in-8 obl. 22"
-        if loose_gregorian_calendar_pattern.match(desc):
-            date_log_path = 1
-            """First, we start reducing the string with a first split using the comma as delimiter, as (usually) there
-            is no comma in a date:
-            ['Pièce de vers aut. sig. sig. aussi par sa femme Caroline Vanhove: 18 janvier 1798', ' 1 p. in-8 obl. 22']"""
-            tokenizedDesc = desc.split(",")
-            string_list = []
-            for tok_item in tokenizedDesc:
-                if loose_gregorian_calendar_pattern.match(tok_item):
-                    string_list.append(tok_item)
-            """We can reduce the list to its last element: it will contain the date, as (usually) there is only a
-            single date:
-            ['Pièce de vers aut. sig. sig. aussi par sa femme Caroline Vanhove: 18 janvier 1798']"""
-            string_list = string_list[-1]
-
-            # Second, we can reduce the string using the semi colon as delimiter.
-            # In our example, it won't affect the string.
-            string_list = string_list.split(";")
-            for elem in string_list:
-                if loose_gregorian_calendar_pattern.match(elem):
-                    string_list = elem
-            # We split the string by the date, keeping it. The year beeing the delimiter, everything after it is not
-            # a date. No change in our example
-            string_list = re.split("(1[0-9][0-9][0-9])", string_list)
-            string_list = string_list[:-1]
-            date_string = ''.join([str(elem) for elem in string_list])
-            # Strip is used to remove leading and trailing spaces.
-            unprocessed_date_string = date_string.strip()
-
-            # Third, we reduce the string using the colon as delimiter.
-            # '18 janvier 1798'
-            date_string = date_string.split(":")
-            for elem in date_string:
-                if loose_gregorian_calendar_pattern.match(elem):
-                    date_string = elem
-            # Etc.
-            date_string = date_string.split("(")
-            for elem in date_string:
-                if loose_gregorian_calendar_pattern.match(elem):
-                    date_string = elem
-
-            date_string = date_string.split("«")
-            for elem in date_string:
-                if loose_gregorian_calendar_pattern.match(elem):
-                    date_string = elem
-
-            date_string = date_string.split(">")
-            for elem in date_string:
-                if loose_gregorian_calendar_pattern.match(elem):
-                    date_string = elem
-
-            # Then we clean the string
-            date_string = re.sub(r'\s+', ' ', date_string)
-            date_string = re.sub(r'\(', '', date_string)
-            date_string = re.sub(r'L\. a\. s\.', '', date_string)
-            # And eventually we can extract the date as a string to process it
-            date = re.sub(r'^\s', '', date_string)
-
-            # This pattern matches strings that contains only a year.
-            gregorian_year_pattern = re.compile("^1[0-9][0-9][0-9]$")
+        elif loose_gregorian_calendar_pattern.match(desc):
+            unprocessed_date_string, date = gregorian_date_string(desc)
             # If the date is a year and nothing else, no need to process it.
             if gregorian_year_pattern.match(date):
-                date_log_path = 2
-                matched = re.finditer(gregorian_year_pattern, date)
-                for match in matched:
-                    desc_xml = desc.replace(match.group(0), f'<date \
-                           xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 when=\u0022{date}\u0022>{match.group(0)}</date>')
+                candidates.append((desc, 2, unprocessed_date_string, date))
             else:
-                # To extrat the date automatically, we use the dateparser library.
-                # see https://dateparser.readthedocs.io/en/v0.2.1/_modules/dateparser/date.html
                 # This is the case where I could not find a way to retrieve the date string.
-                date_log_path = 3
-                split_date = date.replace("(", "").replace(")", "").replace("[", "").split(" ")
-
-                parsed_date = dateparser.date.DateDataParser().get_date_data(u'%s' % date)
-                # if it doesn't work, we select the YYYY string.
-                if parsed_date["date_obj"] is None:
-                    date_log_path = 4
-                    date = re.search("(1[0-9][0-9][0-9])", date).group(0)
-                else:
-                    date_range = re.search("(1[0-9][0-9][0-9])", date).span()
-                    date_log_path = 5
-                    # We get the precision of the date: dateparser will autocomplete
-                    # the date using the current date if it has only the month. That is not what we want.
-                    if parsed_date["period"] == "month":
-                        date = parsed_date["date_obj"].strftime('%Y-%m')
-                    # This statement should never be true.
-                    elif parsed_date["period"] == "year":
-                        date = parsed_date["date_obj"].strftime('%Y')
-                    else:
-                        date = parsed_date["date_obj"].strftime('%Y-%m-%d')
-
-                # Then we inject the normalised date in the @when attribute.
-                desc_xml = desc.replace(unprocessed_date_string, f'<date xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 '
-                                                                 f'when=\u0022{date}\u0022>{unprocessed_date_string}</date>')
-
-            # We update the dictionary.
-            dict_values["date"] = date
-
+                candidates.append((desc, 3, unprocessed_date_string, date))
         # If we do not match a gregorian year string (YYYY), but a republican year string ('an V', for instance),
         # we convert the republican date.
         elif republican_calendar_pattern.match(desc):
-            date_log_path = 6
-            date, date_string = tables.rep_greg_conversion.main(desc)
+            date, date_string, numbers = tables.rep_greg_conversion.republican_date(desc)
+            if numbers is not None:
+                republican.append((len(candidates), numbers))
+            candidates.append((desc, 6, date_string, date))
+        else:
+            candidates.append((desc, None, None, None))
+
+    # The full republican dates are converted in one call.
+    if republican:
+        positions, numbers = zip(*republican)
+        for position, date in zip(positions, tables.calendar_array.convert_many(*zip(*numbers))):
+            desc, date_log_path, date_string, _ = candidates[position]
+            candidates[position] = (desc, date_log_path, date_string, date if date is not None else "none")
+
+    # Second, the distinct date strings are normalised.
+    parsed_dates = {}
+    for desc, date_log_path, unprocessed_date_string, date in candidates:
+        if date_log_path == 3 and date not in parsed_dates:
+            parsed_dates[date] = parse_date_string(date)
+            process_metrics.count("date_strings_total", parsed_dates[date][2])
+
+    # Eventually, the dates are mapped back to the descs.
+    for item, (desc, date_log_path, unprocessed_date_string, date) in zip(descList, candidates):
+        id = item[1]
+        dict_values = input_dict[id]
+        desc_xml = desc
+        if date_log_path == 3:
+            process_metrics.count("date_paths_total", "parsed" if parsed_dates[date][1] == 5 else "year_fallback")
+        else:
+            process_metrics.count("date_paths_total", date_paths[date_log_path])
+        if date_log_path == 2:
+            matched = re.finditer(gregorian_year_pattern, date)
+            for match in matched:
+                desc_xml = desc.replace(match.group(0), f'<date \
+                           xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 when=\u0022{date}\u0022>{match.group(0)}</date>')
+            dict_values["date"] = date
+        elif date_log_path == 3:
+            date, date_log_path, parser = parsed_dates[date]
+            # Then we inject the normalised date in the @when attribute.
+            desc_xml = desc.replace(unprocessed_date_string, f'<date xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 '
+                                                             f'when=\u0022{date}\u0022>{unprocessed_date_string}</date>')
+            dict_values["date"] = date
+        elif date_log_path == 6:
+            # the republican date string and its date were found (and converted) with the other candidates
+            date_string = unprocessed_date_string
             if date_string is not None:
                 desc_xml = desc.replace(date_string, f'<date xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 '
                                                      f'when=\u0022{date}\u0022>{date_string}</date>')
-            else:
-                desc_xml = desc
             dict_values["date"] = date
             dict_values["desc_xml"] = desc_xml
         else:
             dict_values["date"] = None
-            no_date_trigger()
-            desc_xml = desc
-        # dict_values["date_range"] = date_range
         input_dict[id] = dict_values
         item[0] = desc_xml
-    return output_dict
+    process_metrics.count("prefilter_skips_total", "date", skipped)
+    return input_dict
+
+
+# Prefilter: a desc without any of these keywords cannot match the length patterns below (" p" for "1 p.",
+# "3 pages"..., "dep" for "1/2 de p.").
+length_keywords = (" p", "dep")
+# This pattern works with the most frequent cases.
+length_pattern = re.compile(r"([IVXivx0-9\/]{1,6})\.?\s(pages|page|pag.|p.)\s([0-5\/]{0,3})")
+# A fraction of page: "1/2 de page".
+fraction_length_pattern = re.compile(r"([0-9\/]{1,6})\s?de\s?p[age]{0,3}\.?")
+# The values of the non-arabic numbers found by the length patterns: roman numerals and fractions.
+length_values = {**tables.conversion_tables.page_numerals, **tables.conversion_tables.fractions_to_float}
+
+
+def length_search(desc):
+    """
+    Searches the length (number of pages) in a desc.
+    :param desc: the cleaned text of the desc
+    :return: a (span, pages) tuple with the position of the length in desc and the number of pages,
+    or None if no length is found
+    """
+    length_match = length_pattern.search(desc)
+    if length_match is not None:
+        first_group, second_group = length_match.group(1, 3)
+        if first_group.isdigit():
+            value_1 = int(first_group)
+        else:
+            # The lenght can be in roman numbers or a fraction.
+            value_1 = length_values.get(first_group.upper())
+        # If the second group is empty, there is no fraction.
+        if second_group == "":
+            if value_1 is None:
+                value_1 = f'key error, please check the transcription: {first_group}'
+            return length_match.span(), value_1
+        if value_1 is None:
+            value_1 = 501
+        if second_group.isdigit():
+            value_2 = int(second_group)
+        else:
+            value_2 = length_values.get(second_group, 404)
+        return length_match.span(), float(value_1) + float(value_2)
+    fraction_match = fraction_length_pattern.search(desc)
+    if fraction_match is not None:
+        return fraction_match.span(), length_values.get(fraction_match.group(1), 0)
+    return None
 
 
 def length_extractor(descList, input_dict):
@@ -314,188 +473,155 @@ def length_extractor(descList, input_dict):
     :param input_dict: the dictionnary containing the data previously extracted (prices and dates)
     :return: a dict which keys are the ids, and which values are another dict with prices, dates and lenghts
     """
-    print("Extracting length information")
-    # This pattern works with the most frequent cases.
-    length_pattern = re.compile("([IVXivx0-9\/]{1,6})\.?\s(pages|page|pag.|p.)\s([0-5\/]{0,3})")
-    pattern_fraction = re.compile("([0-9\/]{1,6})\s?de\s?p[ages]{0,3}\.?")
+    skipped = 0
     for item in descList:
         desc, id = item[0], item[1]
         desc = clean_text(desc)
-        desc = re.sub(r"\s+", " ", desc)
         desc = desc.replace("p/", "p")
         dict_values = input_dict[id]
-        log_path = None
-        length = None
-        if re.search(length_pattern, desc):
-            position_chaîne = re.search(length_pattern, desc).span()  # divise la chaîne en sous-groupes jcrois
-            pn_search = re.search(length_pattern, desc)
-            first_group = pn_search.group(1)
-            second_group = pn_search.group(3)
-            # If the second group is empty, there is no fraction.
-            if second_group == "":
-                if first_group != "":
-                    if isInt(is_roman(first_group.upper())):
-                        length = int(is_roman(first_group.upper()))
-                        log_path = 1
-                    else:
-                        try:
-                            length = tables.conversion_tables.fractions_to_float[first_group]
-                            log_path = 2
-                        except:
-                            length = f'key error, please check the transcription: {first_group}'
-                            log_path = 3
-            elif first_group != "" and second_group != "":
-                if isInt(first_group):
-                    value_1 = int(first_group)
-                    log_path = 4
-                else:
-                    # The lenght can be in roman numbers.
-                    value_1 = is_roman(first_group.upper())
-                    log_path = 5
-                    if isInt(value_1):
-                        log_path = 6
-                        pass
-                    else:
-                        try:
-                            value_1 = tables.conversion_tables.fractions_to_float[value_1]
-                            log_path = 7
-                        except:
-                            value_1 = 501
-                            log_path = 8
-                if isInt(second_group):
-                    value_2 = int(second_group)
-                    log_path = 9
-                else:
-                    try:
-                        value_2 = tables.conversion_tables.fractions_to_float[second_group]
-                        log_path = 10
-                    except:
-                        value_2 = 404
-                        log_path = 11
-                length = float(value_1) + float(value_2)
-            else:
-                length = None
-                log_path = 12
-        elif re.search(pattern_fraction, desc):
-            log_path = 13
-            search = re.search("([0-9\/]{1,6})\s?de\s?p[age]{0,3}\.?", desc)
-            position_chaîne = search.span()
-            try:  # test to be removed after.
-                length = tables.conversion_tables.fractions_to_float[search.group(1)]
-            except:
-                length = 0
-
-        if length != None:
-            starting_position = position_chaîne[0]
-            ending_position = position_chaîne[1]
+        if contains_any(desc, length_keywords):
+            length_found = length_search(desc)
+        else:
+            skipped += 1
+            length_found = None
+        if length_found is not None:
+            (starting_position, ending_position), length = length_found
             # if a space is the last character of the identified range of page ("1 p. "), we can remove it.
             if desc[ending_position - 1] == " ":
                 ending_position = ending_position - 1
             desc_xml = f'{desc[:starting_position]}<measure xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022' \
                        f' type=\u0022length\u0022 unit=\u0022p\u0022 n=\u0022{length}\u0022>' \
-                       f'{desc[starting_position:ending_position]}</measure>{desc[ending_position:]}' \
-                # desc_xml = desc
+                       f'{desc[starting_position:ending_position]}</measure>{desc[ending_position:]}'
         else:
+            length = None
             desc_xml = desc
-        # dict_values["groups"] = groups # for debugging purposes only
-        # dict_values["path"] = path  # idem
-        # dict_values["desc_xml"] = desc_xml
         dict_values["number_of_pages"] = length
         input_dict[id] = dict_values
         item[0] = desc_xml
+    process_metrics.count("prefilter_skips_total", "length", skipped)
     return input_dict
 
 
+# Prefilter: all the formats start with "in-".
+format_keywords = ("in-",)
+# A single recognizer for the three kinds of formats: "in-8", "in-folio" and "in-f.", in this order of
+# priority (each lookahead searches the whole desc before the next one is tried).
+format_pattern = re.compile(r"(?=.*?(?P<number>in-(?P<size>[0-9]{1,2})°?\.?\s?[obl]{0,3}\.?))"
+                            r"|(?=.*?(?P<folio>in-folio\.?\s?[obl]{0,3}\.?))"
+                            r"|(?=.*?(?P<fol>in-f[ol]{0,2}\.?\s?[obl]{0,3}\.?))", re.DOTALL)
+
+
+def format_codes():
+    """
+    Builds the map from the formats recognized by format_pattern to their code in the format taxonomy. The map
+    is built from tables.conversion_tables.format_types, which also builds the taxonomy (see format_taxonomy()).
+    :return: a dict with (size, oblong) keys, size being the number of "in-N" or "folio", and the codes as values
+    """
+    codes = {}
+    for ms_format, code in tables.conversion_tables.format_types.items():
+        size = ms_format.split("-")[-1]
+        codes[(size, False)] = code
+        codes[(size, True)] = code + 100
+    codes[("folio", False)] = codes[("1", False)]
+    codes[("folio", True)] = codes[("1", True)]
+    return codes
+
+
+format_code_map = format_codes()
+
+
+def format_search(desc):
+    """
+    Searches the format of the manuscript in a desc.
+    :param desc: the desc
+    :return: a (span, code) tuple with the position of the format in desc and its code in the taxonomy (None if
+    the format is not in the taxonomy), or None if no format is found
+    """
+    format_match = format_pattern.match(desc)
+    if format_match is None:
+        return None
+    if format_match.group("number") is not None:
+        group, size = "number", format_match.group("size")
+    elif format_match.group("folio") is not None:
+        group, size = "folio", "folio"
+    else:
+        group, size = "fol", "folio"
+    # let's improve the format identification: the "oblong" cases
+    oblong = "ob" in format_match.group(group)
+    return format_match.span(group), format_code_map.get((size, oblong))
+
+
 def format_extractor(descList, input_dict):
     """
     Extracts the format from the list containing all of the tei:desc, and update the main dict.
-    First, "simple" formats are extracted ; then, others ; then, formats are converted using an external
-    conversion table (see: xml_encoded_format). The whole thing is stored in a <measure> tei element.
+    Formats are recognized with a single pattern, and converted to the format taxonomy with a precomputed map
+    (see format_search()). The whole thing is stored in a <measure> tei element.
     :param descList: the list containing all of the tei:desc
     :param input_dict: the dictionnary containing the data previously extracted
     :return: a dict which keys are the ids, and which values are another dict 
     """
-    print("Extracting format information")
+    skipped = 0
     for item in descList:
         desc, id = item[0], item[1]
         desc_xml = desc
-        ms_format = None
         encoded_ms_format = None
-        xml_encoded_format = None
         dict_values = input_dict[id]
-        format_simple_pattern = re.compile("(in-[0-9]{1,2}°?\.?\s?[obl]{0,3}\.?)")
-        format_simple_pattern2 = re.compile("(in-folio\.?\s?[obl]{0,3}\.?)")
-        format_simple_pattern3 = re.compile("(in-f[ol]{0,2}\.?\s?[obl]{0,3}\.?)")
-
-        if re.search(format_simple_pattern, desc):
-            format_search = re.search(format_simple_pattern, desc)
-            ms_format = re.sub(r"\s$", "", format_search.group(1))
-            position = format_search.span()
-            start_position = position[0]
-            end_position = position[1]
-
-        elif re.search(format_simple_pattern2, desc):
-            format_search = re.search(format_simple_pattern2, desc)
-            ms_format = re.sub(r"\s$", "", format_search.group(1))
-            position = format_search.span()
-            start_position = position[0]
-            end_position = position[1]
-
-        elif re.search(format_simple_pattern3, desc):
-            format_search = re.search(format_simple_pattern3, desc)
-            ms_format = re.sub(r"\s$", "", format_search.group(1))
-            position = format_search.span()
-            start_position = position[0]
-            end_position = position[1]
+        if contains_any(desc, format_keywords):
+            format_found = format_search(desc)
         else:
-            desc_xml = desc
-            start_position = None
-            end_position = None
-
-        # dict_values["desc_xml"] = desc_xml
-        # let's improve the format identification: the "oblong" cases
-        obl_pattern = re.compile(".*ob[l]{0,1}.*")
-        format_pattern = re.compile("(in-[0-9]{1,2})")
-        fol_pattern = re.compile(".*in\-f[olio]?.*")
-        if ms_format is not None:
-            if re.search(fol_pattern, ms_format):
-                xml_encoded_format = '#document_format_1'
-            elif re.search(format_pattern, ms_format):
-                xml_encoded_format = re.search(format_pattern, ms_format).group(1)
-                try:
-                    xml_encoded_format = f'#document_format_{tables.conversion_tables.format_types[xml_encoded_format]}'
-                except:
-                    xml_encoded_format = None
+            skipped += 1
+            format_found = None
+
+        if format_found is not None:
+            (start_position, end_position), code = format_found
+            # xml_encoded_format will be the value of the @ana attribute, pointing to a taxonomy,
+            # while encoded_ms_format is meant for the json output
+            if code is not None:
+                xml_encoded_format = f'#document_format_{code}'
+                encoded_ms_format = str(code)
             else:
                 xml_encoded_format = None
-
-            if xml_encoded_format is not None:
-                if re.search(obl_pattern, ms_format):
-                    xml_encoded_format = f'#document_format_{str(int(xml_encoded_format.split("_")[-1]) + 100)}'
-
-        # Let's create the xml element
-        if start_position and end_position:
-            # if the last character of the identified format is a space, we remove it.
-            if desc[end_position - 1] == " ":
-                end_position = end_position - 1
-            desc_xml = f"{desc[:start_position]}<measure xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 " \
-                       f" type=\u0022format\u0022 unit=\u0022f\u0022 ana=\u0022{xml_encoded_format}\u0022>" \
-                       f"{desc[start_position:end_position]}</measure>{desc[end_position:]}"
-            # desc_xml = desc
+            # Let's create the xml element
+            if start_position and end_position:
+                # if the last character of the identified format is a space, we remove it.
+                if desc[end_position - 1] == " ":
+                    end_position = end_position - 1
+                desc_xml = f"{desc[:start_position]}<measure xmlns=\u0022http://www.tei-c.org/ns/1.0\u0022 " \
+                           f" type=\u0022format\u0022 unit=\u0022f\u0022 ana=\u0022{xml_encoded_format}\u0022>" \
+                           f"{desc[start_position:end_position]}</measure>{desc[end_position:]}"
 
         dict_values["desc_xml"] = desc_xml
-        # xml_encoded_format is meant for the json output, while encoded_ms_format will
-        # be the value of the @ana attribute, pointing to a taxonomy
-        if xml_encoded_format is not None:
-            encoded_ms_format = xml_encoded_format.split('_')[-1]
-        else:
-            xml_encoded_format = None
         dict_values["format"] = encoded_ms_format
         input_dict[id] = dict_values
         item[0] = desc_xml  # we update the list
+    process_metrics.count("prefilter_skips_total", "format", skipped)
     return input_dict
 
 
+# The patterns of the terms, tested in term_extractor().
+apas_pattern = re.compile("((Apostille)\s?a[utographe]{0,9}\.?\s?[signée]{0,6}\.?)")  # > Apas
+pas_pattern = re.compile("(([Pp]ièce|[Pp]\.)\s[^<]*?au[tographe]{1,8}\.?\s?si[gnée]{0,4}\.?)")  # > Pas
+pa_pattern = re.compile("(([Pp]ièce|[Pp]\.)(?!<)\s?[^<]*aut[ographe]{0,7}\.?)")  # > Pa
+ps_pattern = re.compile("(([Pp]ièce|[Pp]\.)\s?(signée|sig|sig\.|s\.))")  # > Ps
+bias_pattern = re.compile("(([Bb]illet|[Bb]\.)\s?a[utographe]{0,9}\.?\s?s[igné]{0,4}\.?)")  # > bias
+bis_pattern = re.compile("(([Bb]illet|[Bb]\.)\s?s[igné]{0,4}\.?)")  # > bis
+las_pattern = re.compile("(([Ll]ettre|[Ll]et\.|[Ll]\.)\s?a[utographe]{0,9}\.?\s?s[ignée]{0,5}\.?)")  # > Las
+la_pattern = re.compile("(([Ll]ettre|[Ll]et\.|[Ll]\.) a[utographe]{0,9}\.?)")  # > La
+ls_pattern = re.compile("(([Ll]ettre|[Ll]et\.|[Ll]\.) (signée|sig\.|s\.))")  # > Ls
+brs_pattern = re.compile("([Bb]revet\.?\s?[signé]{0,5}\.?)")  # > Brs
+qas_pattern = re.compile("([Qq]uitt[ance]{0,4}?\.?\s?[autographe]{0,10}\.?\s?[signée]{0,6}\.?)")  # > Qas
+qs_pattern = re.compile("([Qq]uitt[ance]{0,4}?\.?\s?[signée]{0,6}\.?)")  # > Qs
+ma_pattern = re.compile("([Mm]anuscrit aut[ographe]{0,7}\.?)")  # > Ma
+ca_pattern = re.compile("([Cc]hanson\saut[ographe]{0,7}\.?)")  # > Ca
+as_pattern = re.compile(
+    "((Autographe|autographe|[Aa]ut\.|[Aa]\.)\s?s[ignée]{0,5}\.?)")  # > as # this one must be the last pattern tested.
+
+# Prefilter: one scan for the literal parts that each of the term patterns requires (e.g. "ièce" or "P." for the
+# "Pièce" patterns) ; the descs without any of them cannot match.
+term_prefilter = re.compile(r"[PpBbLlAa]\.|[Ll]et\.|[Aa]ut\.|ièce|illet|ettre|revet|uitt|anuscrit|hanson|utographe|"
+                            r"Apostille")
+
+
 def term_extractor(descList, input_dict):
     """
     Extracts the term from the list containing all of the tei:desc, and update the main dict.
@@ -503,31 +629,19 @@ def term_extractor(descList, input_dict):
     :param input_dict: the dictionnary containing the data previously extracted
     :return: a dict which keys are the ids, and which values are another dict 
     """
-    print("Extracting term information")
+    skipped = 0
     for item in descList:
         desc, id, author, sell_date = item[0], item[1], item[2], item[3]
         desc_xml = desc
         term = None
         dict_values = input_dict[id]
 
-        apas_pattern = re.compile("((Apostille)\s?a[utographe]{0,9}\.?\s?[signée]{0,6}\.?)")  # > Apas
-        pas_pattern = re.compile("(([Pp]ièce|[Pp]\.)\s[^<]*?au[tographe]{1,8}\.?\s?si[gnée]{0,4}\.?)")  # > Pas
-        pa_pattern = re.compile("(([Pp]ièce|[Pp]\.)(?!<)\s?[^<]*aut[ographe]{0,7}\.?)")  # > Pa
-        ps_pattern = re.compile("(([Pp]ièce|[Pp]\.)\s?(signée|sig|sig\.|s\.))")  # > Ps
-        bias_pattern = re.compile("(([Bb]illet|[Bb]\.)\s?a[utographe]{0,9}\.?\s?s[igné]{0,4}\.?)")  # > bias
-        bis_pattern = re.compile("(([Bb]illet|[Bb]\.)\s?s[igné]{0,4}\.?)")  # > bis
-        las_pattern = re.compile("(([Ll]ettre|[Ll]et\.|[Ll]\.)\s?a[utographe]{0,9}\.?\s?s[ignée]{0,5}\.?)")  # > Las
-        la_pattern = re.compile("(([Ll]ettre|[Ll]et\.|[Ll]\.) a[utographe]{0,9}\.?)")  # > La
-        ls_pattern = re.compile("(([Ll]ettre|[Ll]et\.|[Ll]\.) (signée|sig\.|s\.))")  # > Ls
-        brs_pattern = re.compile("([Bb]revet\.?\s?[signé]{0,5}\.?)")  # > Brs
-        qas_pattern = re.compile("([Qq]uitt[ance]{0,4}?\.?\s?[autographe]{0,10}\.?\s?[signée]{0,6}\.?)")  # > Qas
-        qs_pattern = re.compile("([Qq]uitt[ance]{0,4}?\.?\s?[signée]{0,6}\.?)")  # > Qs
-        ma_pattern = re.compile("([Mm]anuscrit aut[ographe]{0,7}\.?)")  # > Ma
-        ca_pattern = re.compile("([Cc]hanson\saut[ographe]{0,7}\.?)")  # > Ca
-        as_pattern = re.compile(
-            "((Autographe|autographe|[Aa]ut\.|[Aa]\.)\s?s[ignée]{0,5}\.?)")  # > as # this one must be the last pattern tested.
-
-        if re.search(pas_pattern, desc):
+        if term_prefilter.search(desc) is None:
+            skipped += 1
+            xml_norm_term = None
+            correct_pattern = None
+
+        elif re.search(pas_pattern, desc):
             term_search = re.search(pas_pattern, desc)
             term = re.sub(r"\s$", "", term_search.group(1))
             xml_norm_term = f'#document_type_{tables.conversion_tables.term_types["P.a.s."]}'
@@ -666,129 +780,759 @@ def term_extractor(descList, input_dict):
         dict_values["author"] = author
         dict_values["sell_date"] = sell_date
         input_dict[id] = dict_values
+    process_metrics.count("prefilter_skips_total", "term", skipped)
     return input_dict
 
 
-def xml_output_production(dictionary, path):
+def xml_output_production(dictionary, xml_file, output_file, errors=None, compress=None, schema=None):
     """
-    This function is used to rewrite all the tei:desc of the output files with the new informations contained in the dictionary.
+    This function is used to rewrite all the tei:desc of an input file with the new informations contained in the
+    dictionary, and to write the result in the output file.
     param dictionary: the dictionary that contains all the informations produced.
-    param path: a path to the output files to rewrite.
+    param xml_file: the path to the input file.
+    param output_file: the path to the tagged output file.
+    param errors: if a list is given, a tagged desc that is not well-formed is recorded in it (see error_record())
+    and the original desc is kept ; otherwise the error is raised.
+    param compress: None, or the compression of the output file ("gzip" or "zstd", see compression.py).
+    param schema: None, or the path to a RELAX NG schema: the tagged tree is validated before it is written, and
+    the invalid descs are recorded in errors (see validation.py) ; the file is written anyway.
+    return: True if the output file was written, False if it was left as it was (same content)
     """
-    print("Updating the xml files")
     # For XPath search
     tei_namespace = "http://www.tei-c.org/ns/1.0"
     NSMAP1 = {'tei': tei_namespace}
     # http://effbot.org/zone/element-namespaces.htm#preserving-existing-namespace-attributes
     ElementTree.register_namespace("", tei_namespace)
 
-    for xml_file in glob.iglob(path):
-        with open(xml_file, 'r+') as fichier:
+    tagged = []
+    with compression.open_file(xml_file, "rb") as fichier:
 
-            tree = etree.parse(fichier)
+        tree = etree.parse(fichier)
 
-            # Add taxonomy to the teiHeader.
-            taxonomy = etree.fromstring(xml_taxonomy)
-            tei_encodingDesc = tree.xpath('//tei:encodingDesc', namespaces=tei)[0]
-            tei_encodingDesc.insert(1, taxonomy)
+        # Add taxonomy to the teiHeader.
+        add_taxonomy(tree)
 
-            # For each desc, with an @xml:id attribute, replace them with their enhanced desc retrieved from the dictionary.
-            for desc in tree.xpath("//tei:desc[@xml:id]", namespaces=NSMAP1):
-                # For now, all desc don't have an @xml:id
-                id = desc.xpath('./@xml:id')[0]
-                desc_string = dictionary[id]["desc_xml"].replace("&", "&amp;")
-                try:
-                    new_desc = etree.fromstring(
-                        "<desc xmlns=\"http://www.tei-c.org/ns/1.0\" xml:id='%s'>%s</desc>" % (id, desc_string))
-                except:
-                    # for some reason the @xmlns may not by added to some files, which generates an error
-                    # if this is the case, add the attribute it by hand
-                    els = new_desc.xpath(".//*", namespaces=tei)
-                    for el in els:
-                        if "xmlns" not in el.attrib.keys():
-                            el.set("xmlns", "http://www.tei-c.org/ns/1.0")
-                desc.getparent().replace(desc, new_desc)
-
-        # Rewrite the file with updated descs.
-        with open(xml_file.replace("clean", "tagged"), "w+") as sortie_xml:
-            output = etree.tostring(tree, pretty_print=True, encoding='utf-8', xml_declaration=True).decode(
-                'utf8')
-            sortie_xml.write(str(output))
-            os.remove(xml_file)
+        # For each desc, with an @xml:id attribute, replace them with their enhanced desc retrieved from the dictionary.
+        for desc in tree.xpath("//tei:desc[@xml:id]", namespaces=NSMAP1):
+            # For now, all desc don't have an @xml:id
+            id = desc.xpath('./@xml:id')[0]
+            desc_string = dictionary[id]["desc_xml"].replace("&", "&amp;")
+            try:
+                new_desc = etree.fromstring(
+                    "<desc xmlns=\"http://www.tei-c.org/ns/1.0\" xml:id='%s'>%s</desc>" % (id, desc_string))
+            except etree.XMLSyntaxError:
+                if errors is None:
+                    raise
+                # the desc is left untagged
+                errors.append(error_record(id, "output"))
+                continue
+            desc.getparent().replace(desc, new_desc)
+            if schema is not None:
+                tagged.append((id, desc, new_desc))
+
+    if schema is not None:
+        with process_metrics.timer("stage_seconds_total", "validate"):
+            invalid = validation.invalid_descs(validation.load_schema(schema), tree, tagged)
+        process_metrics.count("failures_total", "validate", len(invalid))
+        if invalid and errors is None:
+            raise etree.DocumentInvalid(invalid[0]["error"])
+        elif errors is not None:
+            errors.extend(invalid)
+
+    # Rewrite the file with updated descs, unless the output file of a previous run is the same: its modification
+    # time is then kept, and only the files that changed need to be synchronised. The file is written atomically
+    # (see atomic_file.py), so that an interrupted run never leaves a partly written output file.
+    output = etree.tostring(tree, pretty_print=True, encoding='utf-8', xml_declaration=True)
+    if file_digest(output_file) == hashlib.blake2b(output).digest():
+        process_metrics.count("outputs_total", "unchanged")
+        return False
+    with atomic_file.atomic_open(output_file, "wb", compress) as sortie_xml:
+        sortie_xml.write(output)
+    process_metrics.count("outputs_total", "written")
+    return True
+
+
+# ----- LIBRARY API ----- #
+Stage = collections.namedtuple("Stage", ["name", "extractor", "inputs", "outputs"])
+
+# The registry of the extractors, in the order in which they run. Each stage declares the fields of the items that
+# it reads ("desc" being the text of the desc as tagged by the previous stages) and the values of output_dict that
+# it writes: they are used to reuse its results from a previous run (see stage_cache.py).
+stages = [
+    Stage("price", lambda descList, input_dict: price_extractor(descList),
+          inputs=("desc", "author", "price"), outputs=("desc", "price", "author")),
+    Stage("date", date_extractor, inputs=("desc",), outputs=("date", "desc_xml")),
+    Stage("length", length_extractor, inputs=("desc",), outputs=("number_of_pages",)),
+    Stage("format", format_extractor, inputs=("desc",), outputs=("desc_xml", "format")),
+    Stage("term", term_extractor, inputs=("desc", "author", "sell_date"),
+          outputs=("desc_xml", "term", "author", "sell_date")),
+]
+stage_names = [stage.name for stage in stages]
+# The position of the fields in the items of a descList.
+item_fields = {"desc": 0, "id": 1, "author": 2, "sell_date": 3, "price": 4}
+# The extracted fields counted in the metrics (see metrics.py).
+tagged_fields = ("price", "date", "number_of_pages", "format", "term")
+
+
+def run_extractors(descList, errors=None, progress=None, cache=None, selected=None):
+    """
+    Runs all the extractors in order on a descList (as built by desc_extractor()).
+    The items of descList are updated in place, as with the individual extractors.
+    If errors is a list, an item on which an extractor fails is passed through untagged: the error is recorded
+    in errors (see error_record()) and the following extractors skip the item. Otherwise the error is raised.
+    :param descList: a list of [desc, id, author, sell_date, price] lists
+    :param errors: None, or a list in which the errors are recorded
+    :param progress: None, or a function called with (stage, number of descs) after each stage
+    :param cache: None, or the results of the stages from a previous run (see stage_cache.py) ; it is updated in
+    place with the results of this run
+    :param selected: None to run all the stages, or the names of the stages to run: the results of the other
+    stages are taken from the cache, for the items whose inputs did not change
+    :return: a dict which keys are the ids, and which values are another dict with the extracted data
+    """
+    originals = [item[0] for item in descList]
+    output_dict = {item[1]: {} for item in descList}
+    items = list(descList)
+    for stage in stages:
+        count = len(items)
+        reuse = cache is not None and selected is not None and stage.name not in selected
+        if cache is not None:
+            descs = [item[0] for item in items]
+            digests = [stage_cache.digest([item[item_fields[field]] for field in stage.inputs]) for item in items]
+        to_run = []
+        for position, item in enumerate(items):
+            entry = cache.get(stage.name, {}).get(item[1]) if reuse else None
+            if entry is not None and entry["input"] == digests[position]:
+                # the desc is only stored if the stage changed it
+                if entry["desc"] is not None:
+                    item[0] = entry["desc"]
+                output_dict[item[1]].update(entry["values"])
+            else:
+                to_run.append(item)
+        process_metrics.count("items_total", stage.name, count)
+        process_metrics.count("cache_hits_total", stage.name, count - len(to_run))
+        if to_run and errors is None:
+            with process_metrics.timer("stage_seconds_total", stage.name):
+                output_dict.update(stage.extractor(to_run, output_dict))
+        elif to_run:
+            with process_metrics.timer("stage_seconds_total", stage.name):
+                result, passed = run_stage(stage.name, stage.extractor, to_run, output_dict, errors)
+            output_dict.update(result)
+            failed = {id(item) for item in to_run} - {id(item) for item in passed}
+            if cache is not None:
+                descs = [desc for item, desc in zip(items, descs) if id(item) not in failed]
+                digests = [digest for item, digest in zip(items, digests) if id(item) not in failed]
+            items = [item for item in items if id(item) not in failed]
+        if cache is not None:
+            cache[stage.name] = {item[1]: {"input": digest, "desc": item[0] if item[0] != desc else None,
+                                           "values": {key: output_dict[item[1]][key] for key in stage.outputs
+                                                      if key in output_dict[item[1]]}}
+                                 for item, desc, digest in zip(items, descs, digests)}
+        if progress is not None:
+            progress(stage.name, count)
+    # the failed items are passed through untagged
+    tagged = {id(item) for item in items}
+    for item, original in zip(descList, originals):
+        if id(item) not in tagged:
+            item[0] = original
+            output_dict[item[1]] = untagged_values(item)
+    for values in output_dict.values():
+        for field in tagged_fields:
+            if values.get(field) is not None:
+                process_metrics.count("tagged_total", field)
+    return output_dict
 
 
-# ----- UTILS / AUXILIARY FUNCTIONS ----- #
-def clean_text(input_text):
+def run_stage(stage, extractor, descList, input_dict, errors):
     """
-    A function that cleans the text
-    :param text: any string
-    :return: the cleaned string
+    Runs an extractor on all the items at once. If it fails, it is run again item by item, so that only the
+    items on which it fails are left out.
+    :param stage: the name of the stage, for the error log
+    :param extractor: an extractor, called with (descList, input_dict)
+    :param descList: a list of [desc, id, author, sell_date, price] lists
+    :param input_dict: the dictionnary containing the data previously extracted
+    :param errors: the list in which the errors are recorded
+    :return: a (input_dict, descList) tuple, descList being the list of the items on which the extractor succeeded
     """
-    input_text = re.sub('\n', ' ', input_text)
-    input_text = re.sub('\s+', ' ', input_text)
-    output_text = re.sub('\s+$', '', input_text)
-    return output_text
+    descs = [item[0] for item in descList]
+    try:
+        return extractor(descList, input_dict), descList
+    except Exception:
+        pass
+    passed = []
+    for item, desc in zip(descList, descs):
+        # the failed run may have updated some of the items
+        item[0] = desc
+        try:
+            input_dict.update(extractor([item], input_dict))
+            passed.append(item)
+        except Exception:
+            errors.append(error_record(item[1], stage))
+    return input_dict, passed
+
+
+def untagged_values(item):
+    """
+    :param item: a [desc, id, author, sell_date, price] list on which an extractor failed
+    :return: the values of output_dict for an item passed through untagged
+    """
+    desc = clean_text(item[0]) if isinstance(item[0], str) else ""
+    return {"desc": desc, "price": None, "author": item[2], "date": None, "number_of_pages": None,
+            "desc_xml": desc, "format": None, "term": None, "sell_date": item[3]}
+
+
+def error_record(id, stage, file=None):
+    """
+    Builds an entry of the error log from the exception being handled.
+    :param id: the xml:id of the failed item, or None if the error concerns the whole file
+    :param stage: the stage in which the error happened ("price", "date"... see stages, "output" or "file")
+    :param file: the path to the catalogue, if it is known
+    :return: a dict with the file, xml:id, stage, error message and traceback
+    """
+    exception = sys.exc_info()[1]
+    process_metrics.count("failures_total", stage)
+    return {"file": file, "id": id, "stage": stage, "error": f"{type(exception).__name__}: {exception}",
+            "traceback": traceback.format_exc()}
+
+
+def tag_file(xml_file, output_dir, errors=None, progress=None, cache_path=None, selected=None, compress=None,
+             schema=None):
+    """
+    Tags a single catalogue: extracts its descs, runs the extractors and writes the tagged file
+    in the output directory.
+    :param xml_file: the path to a "*_clean.xml" file
+    :param output_dir: the directory in which the "*_tagged.xml" file is written
+    :param errors: None, or a list in which the errors on single items are recorded (see run_extractors())
+    :param progress: None, or a function called with (stage, number of descs) after each stage (see
+    run_extractors()) and after the output ("output" stage)
+    :param cache_path: None, or the path to the cache of the results of the stages (see stage_cache.py), which is
+    read and then updated
+    :param selected: None to run all the stages, or the names of the stages to run (the results of the other
+    stages are taken from the cache, see run_extractors())
+    :param compress: None, or the compression of the tagged file ("gzip" or "zstd", see compression.py)
+    :param schema: None, or the path to a RELAX NG schema against which the tagged file is validated (see
+    xml_output_production())
+    :return: a dict which keys are the ids, and which values are another dict with the extracted data
+    (without the tagged desc, which is in the output file)
+    """
+    list_desc = desc_extractor(xml_file)
+    cache = stage_cache.load(cache_path) if cache_path is not None else None
+    output_dict = run_extractors(list_desc, errors, progress, cache, selected)
+    process_metrics.count("items_total", "output", len(output_dict))
+    with process_metrics.timer("stage_seconds_total", "output"):
+        xml_output_production(output_dict, xml_file, tagged_path(xml_file, output_dir, compress), errors, compress,
+                              schema)
+    if progress is not None:
+        progress("output", len(list_desc))
+    if cache_path is not None:
+        stage_cache.save(cache_path, cache)
+    for key in output_dict:
+        del output_dict[key]["desc_xml"]
+    return output_dict
+
+
+def catalogue_name(xml_file):
+    """
+    :param xml_file: the path to a catalogue file
+    :return: the name of the catalogue: "CAT_XXXXXX"
+    """
+    return os.path.basename(xml_file).split("_clean")[0]
+
+
+def tagged_path(xml_file, output_dir, compress=None):
+    """
+    Builds the path to the tagged version of an input file: "output_dir/CAT_XXXXXX_tagged.xml", followed by the
+    suffix of its compression if any ("CAT_XXXXXX_tagged.xml.gz").
+    :param xml_file: the path to a "*_clean.xml" file, compressed or not
+    :param output_dir: the output directory
+    :param compress: None, or the compression of the tagged file ("gzip" or "zstd")
+    :return: the path to the tagged file
+    """
+    name = os.path.basename(compression.strip_suffix(xml_file)).replace("clean", "tagged")
+    return os.path.join(output_dir, name + compression.SUFFIXES.get(compress, ""))
+
+
+def output_directory(input_dir, root):
+    """
+    Builds the path to the output directory of an input directory: "root/output/INPUT-DIR_tagged".
+    :param input_dir: the path to the input directory, as given in the command line
+    :param root: the root directory of the repository
+    :return: the path to the output directory
+    """
+    # indir_clean : cleaned output directory : removed relative path and trailing "/"
+    indir_clean = re.sub(r"((^\.+/)|(/$))", "", input_dir)
+    return os.path.join(root, "output", f"{indir_clean}_tagged")
+
+
+def tag_descs(records, batch_size=500):
+    """
+    Tags an iterable of descs without reading or writing any file. Each record can be:
+    - a string: the text of the tei:desc (an id is then generated from its position: "desc_N")
+    - a dict with a "desc" key, and optionally "id", "author", "sell_date" and "price" keys
+    - a list or tuple following the desc_extractor() layout: [desc, id, author, sell_date, price]
+    The records are processed in batches of batch_size and are not modified. The results are matched to the
+    records by their ids, so the ids of the records of a batch must be distinct.
+    :param records: an iterable of records
+    :param batch_size: the number of records processed at once
+    :return: an iterator of lists (one for each batch) of dicts with the extracted data and the "id" of the record
+    :raise ValueError: if two records of a batch have the same id
+    """
+    batch = []
+    for position, record in enumerate(records):
+        batch.append(record_to_desc_item(record, position))
+        if len(batch) == batch_size:
+            yield tag_batch(batch)
+            batch = []
+    if batch:
+        yield tag_batch(batch)
+
+
+def tag_batch(descList):
+    """
+    Runs the extractors on a batch of items and returns the results in the order of the batch.
+    :param descList: a list of [desc, id, author, sell_date, price] lists
+    :return: a list of dicts with the extracted data
+    :raise ValueError: if two items have the same id (their results would overwrite each other)
+    """
+    ids = collections.Counter(item[1] for item in descList)
+    duplicates = [id for id, count in ids.items() if count > 1]
+    if duplicates:
+        raise ValueError(f"duplicate ids in the batch: {', '.join(map(str, duplicates))}")
+    output_dict = run_extractors(descList)
+    return [{"id": item[1], **output_dict[item[1]]} for item in descList]
+
+
+def record_to_desc_item(record, position):
+    """
+    Converts a record given to tag_descs() into a [desc, id, author, sell_date, price] list.
+    :param record: a string, a dict or a list (see tag_descs())
+    :param position: the position of the record, used to build an id if the record has none
+    :return: a list following the desc_extractor() layout
+    """
+    if isinstance(record, str):
+        desc, id, author, sell_date, price = record, None, None, None, None
+    elif isinstance(record, dict):
+        desc = record["desc"]
+        id = record.get("id")
+        author = record.get("author")
+        sell_date = record.get("sell_date")
+        price = record.get("price")
+    else:
+        desc, id, author, sell_date, price = record
+    if id is None:
+        id = f"desc_{position}"
+    # price_extractor() expects the price as it is found in the @quantity attribute.
+    if price is not None:
+        price = str(price)
+    return [desc, id, author, sell_date, price]
+
+
+# ----- BATCH RUN ----- #
+def expand_input_dirs(patterns):
+    """
+    Expands the input directories given in the command line: each one can be a path or a glob pattern
+    (e.g. "../*00").
+    :param patterns: a list of paths or glob patterns
+    :return: the list of the matching directories
+    """
+    input_dirs = []
+    for pattern in patterns:
+        if glob.escape(pattern) != pattern:
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern]
+        for match in matches:
+            if os.path.isdir(match) and match not in input_dirs:
+                input_dirs.append(match)
+    return input_dirs
+
+
+def build_tasks(input_dirs, root, resume=False, compress=None):
+    """
+    Creates the output directory of each input directory and builds a single queue of files to tag
+    for all of them. The biggest files come first, so that the parallel workers finish at the same time
+    instead of waiting for a big file started last.
+    The tagged files of the previous run are kept, so that the unchanged ones are not rewritten (see
+    xml_output_production()), but the tagged files without an input file (or with another compression) are
+    removed, and the journal is restarted.
+    A catalogue found both uncompressed and compressed ("CAT_X_clean.xml" and "CAT_X_clean.xml.gz") is only
+    queued once, since both files would be tagged into the same file: the uncompressed one is tagged, and the
+    other one is reported in the log.
+    :param input_dirs: the input directories
+    :param root: the root directory of the repository
+    :param resume: if True, the output directories are left as they are (see journal.split_completed())
+    :param compress: None, or the compression of the tagged files (see tagged_path())
+    :return: a list of (xml_file, output_dir) tuples
+    """
+    tasks = []
+    for input_dir in input_dirs:
+        output_dir = output_directory(input_dir, root)
+        os.makedirs(output_dir, exist_ok=True)
+        # the uncompressed files come first (see compression.INPUT_PATTERNS)
+        catalogues = {}
+        for pattern in compression.INPUT_PATTERNS:
+            for xml_file in sorted(glob.iglob(os.path.join(input_dir, pattern))):
+                catalogue = compression.strip_suffix(xml_file)
+                if catalogue in catalogues:
+                    logging.warning("%s is ignored: %s is the same catalogue", xml_file, catalogues[catalogue])
+                else:
+                    catalogues[catalogue] = xml_file
+        input_files = list(catalogues.values())
+        if not resume:
+            expected = {tagged_path(xml_file, output_dir, compress) for xml_file in input_files}
+            for path in glob.iglob(os.path.join(output_dir, "*_tagged.xml*")):
+                if path not in expected:
+                    os.remove(path)
+            # the journal, and the one older versions wrote in the output directory itself
+            for path in (journal.journal_path(output_dir), os.path.join(output_dir, "journal.jsonl")):
+                if os.path.isfile(path):
+                    os.remove(path)
+        tasks.extend((xml_file, output_dir) for xml_file in input_files)
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+    return tasks
+
+
+def tag_task(xml_file, output_dir, progress=None, cache_dir=None, selected=None, compress=None, schema=None):
+    """
+    Tags a file (see tag_file()) and catches the errors, so that they can be reported with the name of the file:
+    the failed items are passed through untagged, and an error on the whole file does not stop the run.
+    The results of the stages are cached in cache_dir, if it is given (see stage_cache.py).
+    :return: a (output_dict, errors, cost) tuple ; output_dict is None if the file could not be tagged, errors is
+    the list of the entries of the error log (see error_record()), and cost a dict with the number of descs, the
+    number of date strings parsed with dateparser, the CPU seconds spent on the file (see cost_model.py) and the
+    metrics of the file (see metrics.py)
+    """
+    errors = []
+    counters = cost_counters()
+    try:
+        cache_path = stage_cache.cache_path(cache_dir, xml_file, output_dir) if cache_dir is not None else None
+        output_dict = tag_file(xml_file, output_dir, errors, progress, cache_path, selected, compress, schema)
+    except Exception:
+        output_dict = None
+        errors.append(error_record(None, "file"))
+    for error in errors:
+        error["file"] = xml_file
+    return output_dict, errors, cost_since(counters, os.path.getsize(xml_file), output_dict)
+
+
+def cost_counters():
+    """
+    :return: the counters of the current process used to compute the cost of a file (see cost_since())
+    """
+    # the CPU time of the process, which does not depend on the other processes running at the same time
+    return time.process_time(), process_metrics.copy()
 
 
-def no_price_trigger():
+def cost_since(counters, size, output_dict):
+    """
+    :param counters: the counters returned by cost_counters() before the work on the file
+    :param size: the size of the file
+    :param output_dict: the data extracted from the file, or None
+    :return: the cost of the work done since counters (see tag_task())
+    """
+    start, previous_metrics = counters
+    file_metrics = process_metrics.since(previous_metrics)
+    return {"size": size, "descs": len(output_dict) if output_dict is not None else 0,
+            "dateparser_calls": file_metrics.get("date_strings_total", "dateparser"),
+            "seconds": round(time.process_time() - start, 3), "metrics": file_metrics.to_dict()}
+
+
+def merge_costs(costs):
+    """
+    :param costs: the costs of the parts of a file (see tag_chunk() and write_chunked_file())
+    :return: the cost of the whole file
+    """
+    cost = {"size": 0, "descs": 0, "dateparser_calls": 0, "seconds": 0}
+    file_metrics = metrics.Metrics()
+    for part in costs:
+        for key in "size", "descs", "dateparser_calls", "seconds":
+            cost[key] += part[key]
+        file_metrics.merge(part["metrics"])
+    cost["seconds"] = round(cost["seconds"], 3)
+    cost["metrics"] = file_metrics.to_dict()
+    return cost
+
+
+def split_catalogue(xml_file, chunk_size):
     """
-    :return: Increases the counter when called
+    Extracts the descs of a catalogue and splits them into chunks, so that a big catalogue can be tagged by
+    several workers (see run_tasks()).
+    :param xml_file: the path to a "*_clean.xml" file
+    :param chunk_size: the maximum number of descs of a chunk
+    :return: a list of descLists (see desc_extractor()), in the order of the document
     """
-    global no_price
-    no_price += 1
+    list_desc = desc_extractor(xml_file)
+    return [list_desc[position:position + chunk_size] for position in range(0, len(list_desc), chunk_size)]
 
 
-def no_date_trigger():
+def tag_chunk(descList, cache, selected):
     """
-    :return: Increases the counter when called
+    Runs the extractors on a chunk of a catalogue, in a worker (see run_extractors()).
+    :param descList: the chunk (see split_catalogue())
+    :param cache: None, or the cache of the stages for the items of the chunk (see stage_cache.py)
+    :param selected: None to run all the stages, or the names of the stages to run
+    :return: a (output_dict, errors, cache, cost) tuple: the data extracted from the chunk, the errors on its
+    items, the updated cache and the cost of the chunk
     """
-    global no_date
-    no_date += 1
+    errors = []
+    counters = cost_counters()
+    output_dict = run_extractors(descList, errors, send_progress, cache, selected)
+    return output_dict, errors, cache, cost_since(counters, 0, None)
 
 
-def isInt(string):
+def chunk_cache(cache, descList):
     """
-    Check if a string is an integer
-    :param string: the input string
-    :return: True if string is an integer, False if not
-    :rtype: str
+    :param cache: None, or the cache of the stages for a catalogue (see stage_cache.py)
+    :param descList: a chunk of the catalogue (see split_catalogue())
+    :return: None, or the entries of the cache for the items of the chunk
     """
+    if cache is None:
+        return None
+    ids = {item[1] for item in descList}
+    return {stage: {id: entry for id, entry in entries.items() if id in ids} for stage, entries in cache.items()}
+
+
+def merge_chunks(results):
+    """
+    :param results: the results of the chunks of a catalogue, in the order of the document (see tag_chunk())
+    :return: a (output_dict, errors, cache, costs) tuple: the data extracted from all the chunks, in the order of
+    the document (None if a chunk failed), the errors on all the chunks, their cache and their costs
+    """
+    output_dict, errors, cache, costs = {}, [], None, []
+    for chunk_output, chunk_errors, chunk_cache_entries, cost in results:
+        errors.extend(chunk_errors)
+        if cost is not None:
+            costs.append(cost)
+        if chunk_output is None or output_dict is None:
+            output_dict = None
+            continue
+        output_dict.update(chunk_output)
+        if chunk_cache_entries is not None:
+            cache = cache if cache is not None else {}
+            for stage, entries in chunk_cache_entries.items():
+                cache.setdefault(stage, {}).update(entries)
+    return output_dict, errors, cache, costs
+
+
+def write_chunked_file(xml_file, output_dir, output_dict, cache_path, cache, compress=None, schema=None):
+    """
+    Writes the tagged file of a catalogue whose chunks were tagged separately (see tag_file()).
+    :param xml_file: the path to the "*_clean.xml" file
+    :param output_dir: the output directory
+    :param output_dict: the data extracted from all the chunks
+    :param cache_path: None, or the path to the cache of the stages
+    :param cache: the cache of the stages for all the chunks
+    :param compress: None, or the compression of the tagged file (see tag_file())
+    :param schema: None, or the path to a RELAX NG schema against which the tagged file is validated
+    :return: a (output_dict, errors, cost) tuple, as tag_task()
+    """
+    errors = []
+    counters = cost_counters()
     try:
-        int(string)
-        result = isinstance(int(string), int)
-    except:
-        result = False
-    return result
+        process_metrics.count("items_total", "output", len(output_dict))
+        with process_metrics.timer("stage_seconds_total", "output"):
+            xml_output_production(output_dict, xml_file, tagged_path(xml_file, output_dir, compress), errors,
+                                  compress, schema)
+        send_progress("output", len(output_dict))
+        if cache_path is not None:
+            stage_cache.save(cache_path, cache)
+        for key in output_dict:
+            del output_dict[key]["desc_xml"]
+    except Exception:
+        output_dict = None
+        errors.append(error_record(None, "file"))
+    return output_dict, errors, cost_since(counters, os.path.getsize(xml_file), output_dict)
+
+
+# In the worker processes: the queue through which the progress of the stages is sent to the main process.
+worker_progress_queue = None
 
 
-def is_float(string):
+def init_worker(progress_queue, log_queue, log_level):
+    global worker_progress_queue
+    worker_progress_queue = progress_queue
+    if log_queue is not None:
+        run_logging.configure_worker(log_queue, log_level)
+    warm_up_dateparser()
+
+
+def send_progress(stage, count):
+    worker_progress_queue.put((stage, count))
+
+
+def worker_tag_task(xml_file, output_dir, cache_dir, selected, compress, schema):
+    return tag_task(xml_file, output_dir, send_progress, cache_dir, selected, compress, schema)
+
+
+def forward_progress(progress_queue, progress):
+    """
+    Calls progress with the (stage, number of descs) sent by the workers, until None is sent.
     """
-    Check if a string is an float
-    :param string: the input string
-    :return: True if string is an float, False if not.
-    :rtype: bool
+    for stage_progress in iter(progress_queue.get, None):
+        progress(*stage_progress)
+
+
+def run_tasks(tasks, workers, progress=None, cache_dir=None, selected=None, log_queue=None, chunks=None,
+              compress=None, schema=None):
     """
+    Tags the files of the task queue, in the order of the queue, with a pool of processes.
+    The catalogues given in chunks are not tagged by a single worker: their chunks are tagged in parallel, and
+    the tagged file is written once all of them are done, with the descs in the order of the document (the
+    output is the same as with a single worker).
+    :param tasks: a list of (xml_file, output_dir) tuples (see build_tasks())
+    :param workers: the number of processes ; with 1, the files are tagged in the current process
+    :param progress: None, or a function called in the current process with (stage, number of descs) each time
+    a stage is done on a file (see tag_file())
+    :param cache_dir: None, or the directory of the cache of the results of the stages (see tag_task())
+    :param selected: None to run all the stages, or the names of the stages to run (see run_extractors())
+    :param log_queue: None, or the queue to which the workers send their log records (see run_logging.py)
+    :param chunks: None, or a dict with paths to "*_clean.xml" files as keys, and their chunks as values (see
+    split_catalogue()) ; they are ignored with a single worker
+    :param compress: None, or the compression of the tagged files ("gzip" or "zstd", see compression.py)
+    :param schema: None, or the path to a RELAX NG schema against which the tagged files are validated ; it is
+    compiled once by each worker (see validation.py)
+    :return: an iterator of (task, output_dict, errors, cost) tuples, in the order in which the files are done
+    """
+    if workers == 1:
+        if tasks:
+            warm_up_dateparser()
+        for task in tasks:
+            yield (task, *tag_task(*task, progress, cache_dir, selected, compress, schema))
+        return
+    progress_queue = multiprocessing.Queue()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                               initargs=(progress_queue, log_queue, logging.getLogger().level))
+    forwarder = threading.Thread(target=forward_progress, args=(progress_queue, progress or (lambda *_: None)))
+    forwarder.start()
+    chunks = chunks or {}
+    # the results of the chunks of each chunked catalogue, in the order of the document (None until done) ;
+    # once its tagged file is being written, the errors and the costs of its chunks
+    chunk_results = {}
     try:
-        float(string)
-        result = isinstance(float(string), float)
-    except:
-        result = False
-    return result
+        futures = {}
+        for task in tasks:
+            xml_file, output_dir = task
+            if xml_file not in chunks:
+                futures[pool.submit(worker_tag_task, *task, cache_dir, selected, compress, schema)] = (task, None)
+                continue
+            cache_path = stage_cache.cache_path(cache_dir, xml_file, output_dir) if cache_dir is not None else None
+            cache = stage_cache.load(cache_path) if cache_path is not None else None
+            chunk_results[xml_file] = [None] * len(chunks[xml_file])
+            for position, descList in enumerate(chunks[xml_file]):
+                futures[pool.submit(tag_chunk, descList, chunk_cache(cache, descList), selected)] = (task, position)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, position = futures.pop(future)
+                xml_file, output_dir = task
+                if position is None:
+                    yield (task, *future.result())
+                elif position == "output":
+                    output_dict, errors, cost = future.result()
+                    errors_chunks, costs = chunk_results.pop(xml_file)
+                    errors = [dict(error, file=xml_file) for error in errors_chunks + errors]
+                    yield (task, output_dict, errors, merge_costs(costs + [cost]))
+                else:
+                    try:
+                        chunk_results[xml_file][position] = future.result()
+                    except Exception:
+                        chunk_results[xml_file][position] = (None, [error_record(None, "file")], None, None)
+                    if any(result is None for result in chunk_results[xml_file]):
+                        continue
+                    output_dict, errors, cache, costs = merge_chunks(chunk_results[xml_file])
+                    if output_dict is None:
+                        del chunk_results[xml_file]
+                        yield (task, None, [dict(error, file=xml_file) for error in errors], merge_costs(costs))
+                        continue
+                    # all the chunks are done: the tagged file is written by a worker
+                    cache_path = stage_cache.cache_path(cache_dir, xml_file, output_dir) \
+                        if cache_dir is not None else None
+                    write = pool.submit(write_chunked_file, xml_file, output_dir, output_dict, cache_path, cache,
+                                        compress, schema)
+                    futures[write] = (task, "output")
+                    chunk_results[xml_file] = (errors, costs)
+                    pending.add(write)
+    finally:
+        pool.shutdown(cancel_futures=True)
+        progress_queue.put(None)
+        forwarder.join()
 
 
-def is_roman(value):
+# ----- UTILS / AUXILIARY FUNCTIONS ----- #
+def file_digest(path):
     """
-    try to convert a date in roman numbers to a date in arabic numbers
-    :param value: the string to convert
-    :return: if there is no mistake, the date in arabic numbers ; else, the date in roman numbers
-    :rtype: str
+    :param path: the path to a file, compressed or not (see compression.py)
+    :return: the digest of its uncompressed content, or None if it does not exist or cannot be read (a missing,
+    truncated or corrupt output file is always rewritten)
     """
+    digest = hashlib.blake2b()
     try:
-        value in tables.conversion_tables.roman_to_arabic.keys()
-        value = tables.conversion_tables.roman_to_arabic[value]
-        return value
-    except:
-        return value
+        with compression.open_file(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    except Exception:
+        return None
+    return digest.digest()
+
+
+def contains_any(text, keywords):
+    """
+    :return: True if text contains one of the keywords
+    """
+    for keyword in keywords:
+        if keyword in text:
+            return True
+    return False
+
+
+def clean_text(input_text):
+    """
+    A function that cleans the text
+    :param text: any string
+    :return: the cleaned string
+    """
+    input_text = re.sub('\n', ' ', input_text)
+    input_text = re.sub('\s+', ' ', input_text)
+    output_text = re.sub('\s+$', '', input_text)
+    return output_text
+
+
+def taxonomy_category(xml_id, label):
+    """
+    :return: a <category> element of the taxonomy, as a string
+    """
+    return f"""           <category xml:id="{xml_id}">
+              <catDesc>{label}</catDesc>
+           </category>
+"""
+
+
+def format_taxonomy():
+    """
+    Builds the categories of the format taxonomy from tables.conversion_tables.format_types, which
+    is also used to build the codes of the formats (see format_codes()).
+    :return: the <category> elements of the taxonomy, as a string
+    """
+    categories = ""
+    for oblong in (False, True):
+        for ms_format, code in tables.conversion_tables.format_types.items():
+            label = tables.conversion_tables.format_labels[ms_format]
+            if oblong:
+                code, label = code + 100, f"{label} oblong"
+            categories += taxonomy_category(f"document_format_{code}", label)
+    return categories
+
+
+def term_taxonomy():
+    """
+    Builds the categories of the document type taxonomy from tables.conversion_tables.term_types, which
+    is also used by term_extractor().
+    :return: the <category> elements of the taxonomy, as a string
+    """
+    categories = ""
+    for term, code in tables.conversion_tables.term_types.items():
+        categories += taxonomy_category(f"document_type_{code}", tables.conversion_tables.term_labels[term])
+    return categories
 
 
 # This is the taxonomy informations to add to the teiHeader of each output file.
@@ -796,128 +1540,33 @@ xml_taxonomy = """
     <classDecl>
         <taxonomy xml:id="format">
            <desc>Document format</desc>
-           <category xml:id="document_format_1">
-              <catDesc>In-folio</catDesc>
-           </category>
-           <category xml:id="document_format_2">
-              <catDesc>In-2°</catDesc>
-           </category>
-           <category xml:id="document_format_3">
-              <catDesc>In-3°</catDesc>
-           </category>
-           <category xml:id="document_format_4">
-              <catDesc>In-quarto</catDesc>
-           </category>
-           <category xml:id="document_format_8">
-              <catDesc>In-octavo</catDesc>
-           </category>
-           <category xml:id="document_format_12">
-              <catDesc>In-12</catDesc>
-           </category>
-           <category xml:id="document_format_16">
-              <catDesc>In-16</catDesc>
-           </category>
-           <category xml:id="document_format_18">
-              <catDesc>In-18</catDesc>
-           </category>
-           <category xml:id="document_format_32">
-              <catDesc>In-32</catDesc>
-           </category>
-           <category xml:id="document_format_40">
-              <catDesc>In-40</catDesc>
-           </category>
-           <category xml:id="document_format_48">
-              <catDesc>In-48</catDesc>
-           </category>
-           <category xml:id="document_format_64">
-              <catDesc>In-64</catDesc>
-           </category>
-           <category xml:id="document_format_101">
-              <catDesc>In-folio oblong</catDesc>
-           </category>
-           <category xml:id="document_format_102">
-              <catDesc>In-2° oblong</catDesc>
-           </category>
-           <category xml:id="document_format_103">
-              <catDesc>In-3° oblong</catDesc>
-           </category>
-           <category xml:id="document_format_104">
-              <catDesc>In-quarto oblong</catDesc>
-           </category>
-           <category xml:id="document_format_108">
-              <catDesc>In-octavo oblong</catDesc>
-           </category>
-           <category xml:id="document_format_112">
-              <catDesc>In-12 oblong</catDesc>
-           </category>
-           <category xml:id="document_format_116">
-              <catDesc>In-16 oblong</catDesc>
-           </category>
-           <category xml:id="document_format_118">
-              <catDesc>In-18 oblong</catDesc>
-           </category>
-           <category xml:id="document_format_132">
-              <catDesc>In-32 oblong</catDesc>
-           </category>
-           <category xml:id="document_format_140">
-              <catDesc>In-40 oblong</catDesc>
-           </category>
-           <category xml:id="document_format_148">
-              <catDesc>In-48 oblong</catDesc>
-           </category>
-           <category xml:id="document_format_164">
-              <catDesc>In-64 oblong</catDesc>
-           </category>
-        </taxonomy>
+""" + format_taxonomy() + """        </taxonomy>
         <taxonomy xml:id="document_type">
            <desc>Document type</desc>
-           <category xml:id="document_type_1">
-              <catDesc>Apostille autographe signée</catDesc>
-           </category>
-           <category xml:id="document_type_2">
-              <catDesc>Pièce autographe signée</catDesc>
-           </category>
-           <category xml:id="document_type_3">
-              <catDesc>Pièce autographe</catDesc>
-           </category>
-           <category xml:id="document_type_4">
-              <catDesc>Pièce signée</catDesc>
-           </category>
-           <category xml:id="document_type_5">
-              <catDesc>Billet autographe signé</catDesc>
-           </category>
-           <category xml:id="document_type_6">
-              <catDesc>Billet signé</catDesc>
-           </category>
-           <category xml:id="document_type_7">
-              <catDesc>Lettre autographe signée</catDesc>
-           </category>
-           <category xml:id="document_type_8">
-              <catDesc>Lettre autographe</catDesc>
-           </category>
-           <category xml:id="document_type_9">
-              <catDesc>Lettre signée</catDesc>
-           </category>
-           <category xml:id="document_type_10">
-              <catDesc>Brevet signé</catDesc>
-           </category>
-           <category xml:id="document_type_11">
-              <catDesc>Quittance autographe signée</catDesc>
-           </category>
-           <category xml:id="document_type_12">
-              <catDesc>Quittance signée</catDesc>
-           </category>
-           <category xml:id="document_type_13">
-              <catDesc>Manuscrit autographe</catDesc>
-           </category>
-           <category xml:id="document_type_14">
-              <catDesc>Chanson autographe</catDesc>
-           </category>
-           <category xml:id="document_type_15">
-              <catDesc>Document (?) Autographe signé</catDesc>
-           </category>
-        </taxonomy>
+""" + term_taxonomy() + """        </taxonomy>
     </classDecl>"""
+# It is parsed once, and a copy is added to each file (see xml_output_production()).
+taxonomy_element = etree.fromstring(xml_taxonomy)
+
+
+def add_taxonomy(tree):
+    """
+    Adds the taxonomy to the teiHeader of a file. If the file already has it (e.g. it was tagged before), it is
+    replaced, so that the taxonomy is never duplicated.
+    :param tree: the parsed input file
+    """
+    tei_encodingDesc = tree.xpath('//tei:encodingDesc', namespaces=tei)[0]
+    taxonomy = copy.deepcopy(taxonomy_element)
+    existing = tei_encodingDesc.xpath("*[local-name()='classDecl'][*[local-name()='taxonomy']"
+                                      "[@xml:id='format' or @xml:id='document_type']]")
+    if existing:
+        taxonomy.tail = existing[0].tail
+        tei_encodingDesc.replace(existing[0], taxonomy)
+        for duplicate in existing[1:]:
+            tei_encodingDesc.remove(duplicate)
+    else:
+        tei_encodingDesc.insert(1, taxonomy)
+
 
 # ----- COMMAND LINE INTERFACE ----- #
 if __name__ == "__main__":
@@ -926,61 +1575,206 @@ if __name__ == "__main__":
     a normalised <desc>. output files are saved in the output, in a directory that follows the 
     pattern: "INPUT-DIR_tagged"
     """
-    no_price = 0
-    no_date = 0
+    cwd = os.path.dirname(os.path.abspath(__file__))  # current directory : script
+    root = Path(cwd).parent  # root directory : 2_CleanedData
 
     # initiate CLI
     arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument("input", help="input directory")
+    arg_parser.add_argument("input", nargs="+", help="input directories or glob patterns (e.g. '../*00')")
+    arg_parser.add_argument("--workers", type=lambda workers: workers if workers == "auto" else int(workers),
+                            default="auto", help="number of processes used to tag the files, or 'auto' to choose it "
+                                                 "from the costs recorded by the previous runs (default)")
+    arg_parser.add_argument("--compress", choices=list(compression.SUFFIXES),
+                            help="write the tagged files compressed with gzip (.gz) or zstd (.zst, needs the "
+                                 "zstandard library) ; the compressed input files are always read")
+    arg_parser.add_argument("--validate", metavar="SCHEMA",
+                            help="validate the tagged files against this RELAX NG schema (e.g. odd_katabase.rng) "
+                                 "before writing them ; the invalid descs are written in the error log")
+    arg_parser.add_argument("--chunk-size", type=int, default=200,
+                            help="maximum number of descs of the chunks in which the most expensive catalogues are "
+                                 "split, so that several workers tag them (default: 200 ; 0 to never split them)")
+    arg_parser.add_argument("--stats", default=os.path.join(root, "output", "run_stats.json"),
+                            help="JSON file in which the cost of each file is recorded (default: output/run_stats.json)")
+    arg_parser.add_argument("--author-index", nargs="?", const=os.path.join(root, "output", "authors.sqlite"),
+                            help="update an index of the sales by author surname in this sqlite file "
+                                 "(default: output/authors.sqlite)")
+    arg_parser.add_argument("--search-index", nargs="?", const=os.path.join(root, "output", "descs.sqlite"),
+                            help="update a full-text index of the descs in this sqlite file "
+                                 "(default: output/descs.sqlite)")
+    arg_parser.add_argument("--metrics", default=os.path.join(root, "output", "metrics.json"),
+                            help="JSON file in which the metrics of the run are written (default: output/metrics.json)")
+    arg_parser.add_argument("--metrics-prom", default=os.path.join(root, "output", "metrics.prom"),
+                            help="file in which the metrics of the run are written in the Prometheus text format "
+                                 "(default: output/metrics.prom)")
+    arg_parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                            help="minimum level of the messages written in the log (default: INFO) ; the log of "
+                                 "each run is written in output/logs")
+    arg_parser.add_argument("--error-log", default=os.path.join(root, "output", "errors.jsonl"),
+                            help="JSON Lines file in which the errors are written (default: output/errors.jsonl)")
+    arg_parser.add_argument("--stages", type=lambda stages: stages.split(","),
+                            help=f"comma-separated stages to run, among {','.join(stage_names)} (default: all) ; "
+                                 f"the results of the other stages are taken from the stage cache (which is then "
+                                 f"used even without --stage-cache)")
+    arg_parser.add_argument("--stage-cache", nargs="?", const=os.path.join(root, "output", "stage_cache"),
+                            help="cache the results of each stage in this directory (default: output/stage_cache), "
+                                 "to re-run only some stages later with --stages ; the cache is not kept otherwise")
+    arg_parser.add_argument("--resume", action="store_true",
+                            help="resume an interrupted run: the catalogues recorded in the journals "
+                                 "(output/journals), and unchanged since, are not tagged again")
+    arg_parser.add_argument("--progress-interval", type=float, default=30.0,
+                            help="seconds between two throughput lines in the log when the output is not a terminal "
+                                 "(on a terminal, progress bars are shown)")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="watch the input directories and re-tag the *_clean.xml files when they change")
+    arg_parser.add_argument("--sample", type=int, metavar="N",
+                            help="tag a stratified sample of N items (by sale decade and date path) taken from the "
+                                 "results of the previous run, without writing any file, and print what changed")
+    arg_parser.add_argument("--debounce", type=float, default=2.0,
+                            help="seconds without writes to wait before re-tagging a file in --watch mode")
     if len(sys.argv) == 1:
         sys.exit("* Please indicate the relative path to the directory *")
     args = arg_parser.parse_args()
-    input_dir = args.input
-    # clean input directory name and create output directory
-    cwd = os.path.dirname(os.path.abspath(__file__))  # current directory : script
-    root = Path(cwd).parent  # root directory : 2_CleanedData
-    # indir_clean : cleaned output directory : removed relative path and trailing "/"
-    indir_clean = re.sub(r"((^\.+/)|(/$))", "", input_dir)
-    output_dir = os.path.join(root, "output", f"{indir_clean}_tagged")
-    if not os.path.isdir(output_dir):
-        os.makedirs(output_dir)
-    files = '*_clean.xml'
-    input_files = f'{input_dir}/{files}'
-    output_files = f'{output_dir}/{files}'
-    input_dir = os.path.dirname(input_files)
-
-    # copy the input xml files to the output directory ; in the output directory,
-    # xml_output_production will replace the old xml descriptions with the new, normalized
-    # and tagged xml descriptions
-    try:
-        # shutil.copytree contains a mkdir command, we have to delete the directory if it exists
-        shutil.copytree(input_dir, output_dir)
-    except:
-        shutil.rmtree(output_dir)
-        shutil.copytree(input_dir, output_dir)
-
+    if args.stages is not None and not set(args.stages) <= set(stage_names):
+        arg_parser.error(f"unknown stages: {', '.join(set(args.stages) - set(stage_names))}")
+    if args.stages is not None and args.stage_cache is None:
+        args.stage_cache = os.path.join(root, "output", "stage_cache")
     try:
-        list_desc, file = conversion_to_list(input_files)
-        output_dict = price_extractor(list_desc)
-        output_dict = date_extractor(list_desc, output_dict)
-        output_dict = length_extractor(list_desc, output_dict)
-        output_dict = format_extractor(list_desc, output_dict)
-        output_dict = term_extractor(list_desc, output_dict)
-
-        # We write the xml output files.
-        xml_output_production(output_dict, output_files)
-    except:
-        # additional error handling: if there is an error, print the file on which the
-        # error happens, the error message and exit
-        error = traceback.format_exc()  # full error message
-        print(f"ERROR ON FILE --- {file}")
-        print(error)
-        sys.exit(1)
-
-    for key in output_dict:
-        del output_dict[key]["desc_xml"]
-
+        compression.check_available(args.compress)
+    except RuntimeError as error:
+        arg_parser.error(str(error))
+    if args.validate is not None:
+        try:
+            validation.load_schema(args.validate)
+        except (OSError, etree.LxmlError) as error:
+            arg_parser.error(f"cannot load the schema {args.validate}: {error}")
+    input_dirs = expand_input_dirs(args.input)
+    if len(input_dirs) == 0:
+        sys.exit("* No input directory found *")
+    log_file = os.path.join(root, "output", "logs", f"run_{datetime.datetime.now():%Y%m%d-%H%M%S}.log")
+    log_listener, log_queue = run_logging.start_logging(log_file, args.log_level)
+
+    if args.watch:
+        import watcher
+        workers = cost_model.available_cpus() if args.workers == "auto" else args.workers
+        watcher.watch(input_dirs, root, workers=workers, debounce=args.debounce, compress=args.compress,
+                      error_log=args.error_log, schema=args.validate, cache_dir=args.stage_cache,
+                      selected=args.stages, author_index_path=args.author_index,
+                      search_index_path=args.search_index)
+        run_logging.stop_logging(log_listener)
+        sys.exit(0)
+
+    if args.sample is not None:
+        import sample
+        sample.main([output_directory(input_dir, root) for input_dir in input_dirs], args.sample)
+        run_logging.stop_logging(log_listener)
+        sys.exit(0)
+
+    # create the output directories and a single queue of files to tag, biggest files first
+    tasks = build_tasks(input_dirs, root, args.resume, args.compress)
+    completed = []
+    if args.resume:
+        completed, tasks = journal.split_completed(
+            tasks, lambda xml_file, output_dir: tagged_path(xml_file, output_dir, args.compress))
+        print(f"Resuming: {len(completed)} files already done")
+    # the files are ordered by predicted cost, and the number of workers is chosen from the predictions
+    stats = cost_model.load_stats(args.stats)
+    predictions, known = cost_model.predict(stats, {catalogue_name(xml_file): os.path.getsize(xml_file)
+                                                    for xml_file, output_dir in tasks})
+    tasks.sort(key=lambda task: predictions[catalogue_name(task[0])], reverse=True)
+    costs = [predictions[catalogue_name(xml_file)] for xml_file, output_dir in tasks]
+    if args.workers == "auto":
+        workers = cost_model.choose_workers(costs, cost_model.available_cpus()) if known \
+            else max(1, min(cost_model.available_cpus(), len(tasks)))
+    else:
+        workers = args.workers
+    # a catalogue that costs more than the share of a worker would finish last: it is split into chunks
+    chunks = {}
+    if workers > 1 and args.chunk_size > 0:
+        for xml_file, output_dir in tasks:
+            if predictions[catalogue_name(xml_file)] > sum(costs) / workers:
+                catalogue_chunks = split_catalogue(xml_file, args.chunk_size)
+                if len(catalogue_chunks) > 1:
+                    chunks[xml_file] = catalogue_chunks
+    print(f"Tagging {len(tasks)} files from {len(input_dirs)} directories with {workers} workers")
+    if chunks:
+        print(f"Splitting {len(chunks)} catalogues into chunks of {args.chunk_size} descs")
+    if known:
+        chunk_costs = []
+        for xml_file, output_dir in tasks:
+            parts = len(chunks.get(xml_file, [None]))
+            chunk_costs += [predictions[catalogue_name(xml_file)] / parts] * parts
+        predicted_runtime = cost_model.predicted_runtime(chunk_costs, workers, cost_model.available_cpus())
+        print(f"Predicted runtime: {predicted_runtime:.1f}s")
+    start = time.perf_counter()
+    if args.author_index:
+        author_connection = author_index.connect(args.author_index)
+    if args.search_index:
+        search_connection = search_index.connect(args.search_index)
+    # the indexes are brought up to date with the results of the previous run
+    for (xml_file, output_dir), output_dict in completed:
+        if args.author_index:
+            author_index.update_catalogue(author_connection, catalogue_name(xml_file), output_dict)
+        if args.search_index:
+            search_index.update_catalogue(search_connection, catalogue_name(xml_file), output_dict)
+    # the errors do not stop the run: each one is written in the error log, with its file, xml:id and stage
+    failed_files, failed_items, invalid_items = 0, 0, 0
+    descs, run_metrics = 0, metrics.Metrics()
+    sizes = {xml_file: os.path.getsize(xml_file) for xml_file, output_dir in tasks}
+    run_progress = progress.Progress(len(tasks), sum(sizes.values()), stage_names + ["output"],
+                                     interval=args.progress_interval)
+    journal_writer = journal.JournalWriter()
+    with open(args.error_log, "a" if args.resume else "w") as error_log:
+        for (xml_file, output_dir), output_dict, errors, cost in run_tasks(tasks, workers, run_progress.advance,
+                                                                                args.stage_cache, args.stages,
+                                                                                log_queue, chunks, args.compress,
+                                                                                args.validate):
+            run_progress.file_done(sizes[xml_file])
+            descs += cost["descs"]
+            run_metrics.merge(cost.pop("metrics"))
+            run_metrics.count("files_total", "failed" if output_dict is None else "done")
+            # the costs are only recorded for the runs of all the stages
+            if output_dict is not None and args.stages is None:
+                stats[catalogue_name(xml_file)] = cost
+            for error in errors:
+                error_log.write(json.dumps(error, ensure_ascii=False) + "\n")
+            error_log.flush()
+            if output_dict is None:
+                failed_files += 1
+                run_progress.write(f"ERROR ON FILE --- {xml_file}")
+                run_progress.write(errors[-1]["error"])
+                continue
+            invalid = sum(error["stage"] == "validate" for error in errors)
+            invalid_items += invalid
+            failed_items += len(errors) - invalid
+            if args.author_index:
+                author_index.update_catalogue(author_connection, catalogue_name(xml_file), output_dict)
+            if args.search_index:
+                search_index.update_catalogue(search_connection, catalogue_name(xml_file), output_dict)
+            # the file is journaled once it is completely done
+            journal_writer.record(xml_file, output_dir, output_dict)
+    journal_writer.close()
+    run_progress.close()
+    cost_model.save_stats(args.stats, stats)
+    runtime = time.perf_counter() - start
+    run_metrics.set("run_seconds", value=round(runtime, 3))
+    run_metrics.save(args.metrics, args.metrics_prom)
+    outputs = run_metrics.values["outputs_total"]
+    if outputs:
+        print(f"Tagged files: {outputs['written']} written, {outputs['unchanged']} unchanged")
+    skipped = run_metrics.values["prefilter_skips_total"]
+    if skipped:
+        print("Descs skipped by the prefilters: " + ", ".join(f"{stage} {skipped[stage]}/{descs}"
+                                                             for stage in stage_names if stage in skipped))
+    if known:
+        print(f"Actual runtime: {runtime:.1f}s (predicted: {predicted_runtime:.1f}s)")
+    else:
+        print(f"Actual runtime: {runtime:.1f}s")
+
+    if failed_files or failed_items:
+        print(f"{failed_files} files failed and {failed_items} items were left untagged, see {args.error_log}")
+    if invalid_items:
+        print(f"{invalid_items} validation errors against {args.validate}, see {args.error_log}")
     print("Done !")
-    # print(f'Number of entries without price: {str(no_price)}')
-    # print(f'Number of entries without date: {str(no_date)}')
-
+    run_logging.stop_logging(log_listener)
+    if failed_files:
+        sys.exit(1)
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Journal of a run of extractor_xml.py, used to resume an interrupted run (--resume).
+# Each output directory "output/INPUT-DIR_tagged" has a journal "output/journals/INPUT-DIR.jsonl", with one line
+# for each catalogue that was tagged: the name of the input file, its size and modification time, and the data
+# extracted from it. The journals are kept out of the directories of the tagged files, which are published.
+# A catalogue is only journaled once its tagged file is written (atomically) and the indexes are
+# updated, so every catalogue of the journal is complete ; a catalogue that changed since is tagged again.
+# -----------------------------------------------------------
+
+import json
+import os
+
+JOURNALS = "journals"
+
+
+def journal_path(output_dir):
+    """
+    :param output_dir: an output directory ("output/INPUT-DIR_tagged")
+    :return: the path to its journal: "output/journals/INPUT-DIR.jsonl"
+    """
+    name = os.path.basename(os.path.normpath(output_dir))
+    if name.endswith("_tagged"):
+        name = name[:-len("_tagged")]
+    return os.path.join(os.path.dirname(os.path.normpath(output_dir)), JOURNALS, f"{name}.jsonl")
+
+
+def signature(xml_file):
+    """
+    :param xml_file: the path to a "*_clean.xml" file
+    :return: the [size, modification time in ns] of the file, used to detect the changes
+    """
+    stat = os.stat(xml_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_journal(output_dir):
+    """
+    Reads the journal of an output directory. A line that was not completely written (the run was
+    interrupted while writing it) is ignored.
+    :param output_dir: an output directory
+    :return: a dict with the names of the input files as keys, and the entries of the journal as values
+    """
+    entries = {}
+    if not os.path.isfile(journal_path(output_dir)):
+        return entries
+    with open(journal_path(output_dir), "r") as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry["file"]] = entry
+    return entries
+
+
+def split_completed(tasks, tagged_path):
+    """
+    Separates the tasks that were completed by a previous run from the others.
+    :param tasks: a list of (xml_file, output_dir) tuples
+    :param tagged_path: the function that builds the path to the tagged file (see extractor_xml.tagged_path())
+    :return: a (completed, remaining) tuple: completed is a list of (task, output_dict) tuples, output_dict
+    being the data extracted by the previous run, and remaining the list of the tasks left to do
+    """
+    journals = {}
+    completed, remaining = [], []
+    for xml_file, output_dir in tasks:
+        if output_dir not in journals:
+            journals[output_dir] = read_journal(output_dir)
+        entry = journals[output_dir].get(os.path.basename(xml_file))
+        if entry is not None and entry["signature"] == signature(xml_file) \
+                and os.path.isfile(tagged_path(xml_file, output_dir)):
+            completed.append(((xml_file, output_dir), entry["results"]))
+        else:
+            remaining.append((xml_file, output_dir))
+    return completed, remaining
+
+
+class JournalWriter:
+    """
+    Appends the completed catalogues to the journals of their output directories.
+    """
+    def __init__(self):
+        self.files = {}
+
+    def record(self, xml_file, output_dir, output_dict):
+        """
+        Journals a catalogue once it is completely done. The line is flushed to the disk before returning.
+        :param xml_file: the path to the input file
+        :param output_dir: its output directory
+        :param output_dict: the data extracted from it (see extractor_xml.tag_file())
+        """
+        if output_dir not in self.files:
+            os.makedirs(os.path.dirname(journal_path(output_dir)), exist_ok=True)
+            self.files[output_dir] = open(journal_path(output_dir), "a")
+        journal_file = self.files[output_dir]
+        entry = {"file": os.path.basename(xml_file), "signature": signature(xml_file), "results": output_dict}
+        journal_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    def close(self):
+        for journal_file in self.files.values():
+            journal_file.close()
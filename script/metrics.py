@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Metrics of the extractors: the number of items seen by each stage, the number of items tagged for each
+# field, how the dates were found, the prefilter skips, the failures and the CPU seconds of each stage.
+# Each process updates its own Metrics (extractor_xml.process_metrics) ; the metrics of a file are the difference
+# between two copies (see Metrics.since()), they are sent back to the main process with the cost of the file
+# and merged there (see Metrics.merge()).
+# At the end of a run, the metrics are written as JSON (output/metrics.json) and in the Prometheus text
+# format (output/metrics.prom, e.g. for the textfile collector of node_exporter).
+# -----------------------------------------------------------
+
+import collections
+import contextlib
+import json
+import time
+
+import atomic_file
+
+PREFIX = "katabase_"
+
+# The known metrics: name -> (Prometheus type, label, help).
+METRICS = {
+    "items_total": ("counter", "stage", "Items seen by each stage (price, date, length, format, term, output)"),
+    "cache_hits_total": ("counter", "stage", "Items whose results were taken from the stage cache"),
+    "tagged_total": ("counter", "field", "Items with a value for each extracted field"),
+    "date_paths_total": ("counter", "path", "How the date of each item was found (year, parsed, year_fallback, "
+                                            "republican, none)"),
+    "date_strings_total": ("counter", "parser", "Distinct date strings of each file, by parser (native, dateparser)"),
+    "prefilter_skips_total": ("counter", "stage", "Items not searched by a stage because they cannot match"),
+    "failures_total": ("counter", "stage", "Errors recorded in the error log, by stage"),
+    "stage_seconds_total": ("counter", "stage", "CPU seconds spent in each stage (output includes validate)"),
+    "files_total": ("counter", "status", "Files tagged (done) or skipped on an error (failed)"),
+    "outputs_total": ("counter", "status", "Tagged files written, or left unchanged because their content is the same"),
+    "run_seconds": ("gauge", None, "Duration of the run"),
+}
+
+
+class Metrics:
+    """
+    Labelled counters that can be copied, subtracted and merged.
+    """
+    def __init__(self, values=None):
+        """
+        :param values: None, or a dict with the names of the metrics as keys, and dicts {label value: value} as
+        values (see to_dict())
+        """
+        self.values = collections.defaultdict(collections.Counter)
+        for name, counter in (values or {}).items():
+            self.values[name].update(counter)
+
+    def count(self, name, label="", value=1):
+        """
+        Adds value to a metric.
+        :param name: the name of the metric (see METRICS)
+        :param label: the value of its label ("" for a metric without label)
+        :param value: the number to add
+        """
+        self.values[name][label] += value
+
+    def set(self, name, label="", value=0):
+        """
+        Sets the value of a metric (for the gauges).
+        """
+        self.values[name][label] = value
+
+    @contextlib.contextmanager
+    def timer(self, name, label=""):
+        """
+        Adds the CPU seconds spent in the with block to a metric.
+        """
+        start = time.process_time()
+        try:
+            yield
+        finally:
+            self.count(name, label, time.process_time() - start)
+
+    def get(self, name, label=""):
+        return self.values[name][label] if name in self.values else 0
+
+    def copy(self):
+        return Metrics(self.to_dict())
+
+    def since(self, previous):
+        """
+        :param previous: a copy of these metrics made earlier
+        :return: the metrics of what was done since the copy
+        """
+        difference = Metrics()
+        for name, counter in self.values.items():
+            for label, value in counter.items():
+                value -= previous.get(name, label)
+                if value:
+                    difference.values[name][label] = value
+        return difference
+
+    def merge(self, other):
+        """
+        Adds the metrics of another process (or file) to these metrics.
+        :param other: a Metrics, or a dict as returned by to_dict()
+        """
+        other = other.to_dict() if isinstance(other, Metrics) else other
+        for name, counter in other.items():
+            self.values[name].update(counter)
+
+    def to_dict(self):
+        """
+        :return: a dict with the names of the metrics as keys, and dicts {label value: value} as values
+        """
+        return {name: dict(counter) for name, counter in self.values.items() if counter}
+
+    def to_prometheus(self):
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, counter in sorted(self.values.items()):
+            if not counter:
+                continue
+            metric_type, label_name, help_text = METRICS.get(name, ("untyped", "label", name))
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+            for label, value in sorted(counter.items()):
+                value = round(value, 3) if isinstance(value, float) else value
+                labels = f'{{{label_name}="{label}"}}' if label != "" else ""
+                lines.append(f"{PREFIX}{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, json_path=None, prometheus_path=None):
+        """
+        Writes the metrics as JSON and/or in the Prometheus text format (see atomic_file.py).
+        """
+        for path, text in ((json_path, lambda: json.dumps(self.to_dict(), indent=1, sort_keys=True)),
+                           (prometheus_path, self.to_prometheus)):
+            if path is None:
+                continue
+            with atomic_file.atomic_open(path) as metrics_file:
+                metrics_file.write(text())
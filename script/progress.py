@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Progress of a run of extractor_xml.py: the number of files (and bytes) tagged, and the number of descs
+# that went through each stage (price, date, length, format, term and output), with their throughput.
+#
+# - on a terminal, a tqdm progress bar is shown for the files (with the ETA) and for each stage (with the
+#   number of descs per second)
+# - otherwise (e.g. when the output is redirected to a file), a line with the same figures is logged every
+#   `interval` seconds ; the throughput of each stage is computed over the last interval, so that a stage
+#   that is stuck shows up at once
+# -----------------------------------------------------------
+
+import datetime
+import logging
+import sys
+import threading
+import time
+
+from tqdm import tqdm
+
+
+class Progress:
+    """
+    Gathers the progress of the files and of the stages of a run, and reports it.
+    """
+    def __init__(self, files, total_bytes, stages, interval=30.0, tty=None):
+        """
+        :param files: the number of files to tag
+        :param total_bytes: the total size of the files to tag
+        :param stages: the names of the stages, in order
+        :param interval: the number of seconds between two throughput lines when the output is not a terminal
+        :param tty: whether to show progress bars ; by default, if the standard error is a terminal
+        """
+        self.files = files
+        self.total_bytes = total_bytes
+        self.files_done = 0
+        self.bytes_done = 0
+        self.counts = {stage: 0 for stage in stages}
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.tty = sys.stderr.isatty() if tty is None else tty
+        self.bars = {}
+        self.stopped = threading.Event()
+        self.reporter = None
+        if self.tty:
+            self.bars["files"] = tqdm(total=total_bytes, desc="files", unit="B", unit_scale=True, position=0)
+            for position, stage in enumerate(stages, start=1):
+                self.bars[stage] = tqdm(desc=stage, unit=" descs", position=position)
+        else:
+            self.interval = interval
+            self.reporter = threading.Thread(target=self.report_periodically, daemon=True)
+            self.reporter.start()
+
+    def advance(self, stage, count):
+        """
+        Records that count descs went through a stage.
+        """
+        with self.lock:
+            self.counts[stage] += count
+        if self.tty:
+            self.bars[stage].update(count)
+
+    def file_done(self, size):
+        """
+        Records that a file of size bytes is done.
+        """
+        with self.lock:
+            self.files_done += 1
+            self.bytes_done += size
+        if self.tty:
+            self.bars["files"].set_postfix_str(f"{self.files_done}/{self.files} files", refresh=False)
+            self.bars["files"].update(size)
+
+    def write(self, message):
+        """
+        Prints a message without breaking the progress bars.
+        """
+        if self.tty:
+            tqdm.write(message)
+        else:
+            print(message)
+
+    def report_periodically(self):
+        previous_counts, previous_time = dict(self.counts), self.start
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            with self.lock:
+                counts = dict(self.counts)
+            logging.info(self.throughput_line(counts, previous_counts, now - previous_time))
+            previous_counts, previous_time = counts, now
+
+    def throughput_line(self, counts, previous_counts, elapsed):
+        """
+        :param counts: the number of descs of each stage
+        :param previous_counts: the number of descs of each stage at the previous report
+        :param elapsed: the number of seconds since the previous report
+        :return: a line like "12/100 files (8%), 1.2 MB/s, ETA 0:02:10 | price 1520 descs (310/s) | ..."
+        """
+        run_time = time.monotonic() - self.start
+        speed = self.bytes_done / run_time if run_time else 0
+        eta = datetime.timedelta(seconds=round((self.total_bytes - self.bytes_done) / speed)) if speed else "?"
+        percent = 100 * self.bytes_done // self.total_bytes if self.total_bytes else 100
+        line = f"{self.files_done}/{self.files} files ({percent}%), {speed / 1e6:.1f} MB/s, ETA {eta}"
+        for stage, count in counts.items():
+            rate = (count - previous_counts[stage]) / elapsed if elapsed else 0
+            line += f" | {stage} {count} descs ({rate:.0f}/s)"
+        return line
+
+    def close(self):
+        """
+        Stops the reports ; a last line is logged when the output is not a terminal.
+        """
+        if self.tty:
+            for bar in self.bars.values():
+                bar.close()
+        else:
+            self.stopped.set()
+            self.reporter.join()
+            with self.lock:
+                counts = dict(self.counts)
+            run_time = time.monotonic() - self.start
+            logging.info(self.throughput_line(counts, {stage: 0 for stage in counts}, run_time))
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Logging of a run of extractor_xml.py. Logging is only configured by the command line interface
+# (--log-level), never when the modules are imported.
+# The records of the main process and of the workers are put in a multiprocessing queue by a QueueHandler,
+# and a QueueListener thread of the main process writes them to the standard error and to a log file of the
+# run (output/logs/run_YYYYMMDD-HHMMSS.log): the extractors never wait for a write to the disk.
+# The records are written to the standard error through tqdm.write(), so that they do not break the progress
+# bars shown on a terminal (see progress.py).
+# -----------------------------------------------------------
+
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import sys
+
+from tqdm import tqdm
+
+FORMAT = "%(asctime)s %(levelname)-8s [%(processName)s %(filename)s:%(lineno)d] %(message)s"
+
+
+class TqdmHandler(logging.Handler):
+    """
+    Writes the records to the standard error above the progress bars (the bars are redrawn below them).
+    """
+    def emit(self, record):
+        try:
+            tqdm.write(self.format(record), file=sys.stderr)
+        except Exception:
+            self.handleError(record)
+
+
+def start_logging(log_file, level):
+    """
+    Configures the logging of the main process and starts writing the records.
+    :param log_file: the path to the log file of the run
+    :param level: the name of the minimum level of the records ("DEBUG", "INFO"...) ; the records of a lower
+    level are not even created
+    :return: a (listener, log_queue) tuple: the listener must be stopped at the end of the run (see
+    stop_logging()), and the queue given to the workers (see configure_worker())
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    formatter = logging.Formatter(FORMAT)
+    file_handler = logging.FileHandler(log_file, mode="w", encoding="utf-8")
+    stream_handler = TqdmHandler()
+    for handler in file_handler, stream_handler:
+        handler.setFormatter(formatter)
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+    listener.start()
+    configure_worker(log_queue, level)
+    return listener, log_queue
+
+
+def configure_worker(log_queue, level):
+    """
+    Sends the records of the current process to the queue (in the workers, the queue is read by the listener
+    of the main process).
+    :param log_queue: the queue returned by start_logging()
+    :param level: the name of the minimum level of the records
+    """
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level)
+
+
+def stop_logging(listener):
+    """
+    Writes the remaining records and closes the log file.
+    """
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Sample mode of extractor_xml.py (--sample N), to see the effect of a change of an extractor in a few seconds.
+# The items are taken from the results of the previous run, recorded in the journals of the output directories
+# (output/journals, see journal.py): no XML file is read or written.
+# - the items are grouped in strata by sale decade and by date path, i.e. the precision of the date found by the
+#   previous run (none, year, month or day) ; the strata only depend on the previous results, so that the sample
+#   does not change while the extractors are being edited
+# - N items are drawn: at least one by stratum, the others in proportion to the size of the strata ; in each
+#   stratum, the items are ordered by a hash of their xml:id, so that the sample is the same from one run to the
+#   next (and only grows with the corpus)
+# - the extractors are run on the sample, and the values that changed since the previous run are printed,
+#   field by field
+# -----------------------------------------------------------
+
+import collections
+import hashlib
+import time
+
+import extractor_xml
+import journal
+
+# The fields compared with the previous run.
+FIELDS = ("price", "author", "sell_date", "date", "number_of_pages", "format", "term")
+# The date paths, by length of the normalised date.
+DATE_PATHS = {4: "year", 7: "month", 10: "day"}
+
+
+def load_previous(output_dirs):
+    """
+    :param output_dirs: the output directories of the input directories
+    :return: a dict with the xml:ids as keys, and the values extracted by the previous run as values
+    """
+    previous = {}
+    for output_dir in output_dirs:
+        for entry in journal.read_journal(output_dir).values():
+            previous.update(entry["results"])
+    return previous
+
+
+def stratum(values):
+    """
+    :param values: the values extracted from an item
+    :return: the (sale decade, date path) stratum of the item
+    """
+    sell_date = values.get("sell_date") or ""
+    decade = f"{sell_date[:3]}0s" if sell_date[:4].isdigit() else "unknown"
+    date = values.get("date")
+    return decade, "none" if date is None else DATE_PATHS.get(len(date), "other")
+
+
+def allocate(sizes, size):
+    """
+    :param sizes: a dict with the strata as keys, and their number of items as values
+    :param size: the size of the sample
+    :return: a dict with the strata as keys, and the number of items to draw from them as values
+    """
+    if size >= sum(sizes.values()):
+        return dict(sizes)
+    strata = sorted(sizes, key=lambda key: (-sizes[key], key))
+    if size <= len(strata):
+        return {key: 1 for key in strata[:size]}
+    # one item by stratum, the others in proportion to the remaining items of the strata (largest remainders)
+    remaining = size - len(strata)
+    total = sum(sizes[key] - 1 for key in strata)
+    quotas = {key: remaining * (sizes[key] - 1) / total for key in strata}
+    allocation = {key: 1 + int(quotas[key]) for key in strata}
+    left = size - sum(allocation.values())
+    for key in sorted(strata, key=lambda key: (int(quotas[key]) - quotas[key], key)):
+        if left == 0:
+            break
+        if allocation[key] < sizes[key]:
+            allocation[key] += 1
+            left -= 1
+    return allocation
+
+
+def draw(previous, size):
+    """
+    Draws a deterministic stratified sample of the items.
+    :param previous: the values extracted by the previous run (see load_previous())
+    :param size: the size of the sample
+    :return: a (ids, strata) tuple: the xml:ids of the sample, in a stable order, and the number of strata
+    """
+    strata = collections.defaultdict(list)
+    for id, values in previous.items():
+        strata[stratum(values)].append(id)
+    allocation = allocate({key: len(ids) for key, ids in strata.items()}, size)
+    sample = []
+    for key in sorted(allocation):
+        ids = sorted(strata[key], key=lambda id: hashlib.blake2b(id.encode("utf-8"), digest_size=8).digest())
+        sample.extend(ids[:allocation[key]])
+    return sample, len(strata)
+
+
+def run_sample(previous, ids):
+    """
+    Runs the extractors on the items of the sample.
+    :param previous: the values extracted by the previous run
+    :param ids: the xml:ids of the sample
+    :return: a (output_dict, errors) tuple (see extractor_xml.run_extractors())
+    """
+    descList = []
+    for id in ids:
+        values = previous[id]
+        # the price is given to price_extractor() as it is found in the @quantity attribute
+        price = str(values["price"]) if values["price"] is not None else None
+        descList.append([values["desc"], id, values["author"], values["sell_date"], price])
+    errors = []
+    output_dict = extractor_xml.run_extractors(descList, errors)
+    return output_dict, errors
+
+
+def diff(previous, output_dict, ids):
+    """
+    :return: a dict with the fields as keys, and the lists of (xml:id, previous value, new value) tuples of the
+    items whose value changed as values
+    """
+    changes = {field: [] for field in FIELDS}
+    for id in ids:
+        for field in FIELDS:
+            old, new = previous[id].get(field), output_dict[id].get(field)
+            if old != new:
+                changes[field].append((id, old, new))
+    return changes
+
+
+def main(output_dirs, size):
+    """
+    Draws a sample, tags it and prints the differences with the previous run.
+    :param output_dirs: the output directories of the input directories
+    :param size: the size of the sample
+    :return: the number of items whose values changed, or None if there is no previous run
+    """
+    previous = load_previous(output_dirs)
+    if not previous:
+        print("No previous results in the journals of the output directories: run without --sample first")
+        return None
+    ids, strata = draw(previous, size)
+    start = time.perf_counter()
+    output_dict, errors = run_sample(previous, ids)
+    print(f"Sample of {len(ids)} items from {strata} strata (sale decade, date path) of {len(previous)} items, "
+          f"tagged in {time.perf_counter() - start:.1f}s")
+    changes = diff(previous, output_dict, ids)
+    for field, field_changes in changes.items():
+        print(f"{field}: {len(field_changes)} changed")
+        for id, old, new in field_changes:
+            print(f"  {id}: {old!r} -> {new!r}")
+    for error in errors:
+        print(f"ERROR ON ITEM --- {error['id']} ({error['stage']}): {error['error']}")
+    return len({id for field_changes in changes.values() for id, old, new in field_changes})
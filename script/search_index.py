@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Full-text index of the descs, built by extractor_xml.py (--search-index) and stored in a sqlite file.
+# The cleaned text of the descs is indexed with FTS5, and the data extracted from them (date, price,
+# number of pages, format, term) are stored in columns that can be used as filters.
+# Usage : python3 search_index.py ../output/descs.sqlite '"L. a. s."' --author Cherubini --from 1790 --to 1800
+#         --max-price 20
+# -----------------------------------------------------------
+
+import argparse
+import re
+import sqlite3
+
+import author_index
+
+# The descs are stored in a regular table, and indexed by an external content FTS5 table kept up to date
+# by triggers (see https://www.sqlite.org/fts5.html#external_content_tables).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS descs (
+    rowid INTEGER PRIMARY KEY,
+    catalogue TEXT NOT NULL,
+    id TEXT NOT NULL,
+    author TEXT,
+    desc TEXT,
+    date TEXT,
+    year INTEGER,
+    price REAL,
+    number_of_pages REAL,
+    format TEXT,
+    term TEXT
+);
+CREATE INDEX IF NOT EXISTS descs_catalogue ON descs (catalogue);
+CREATE VIRTUAL TABLE IF NOT EXISTS descs_fts USING fts5(
+    desc, content='descs', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS descs_insert AFTER INSERT ON descs BEGIN
+    INSERT INTO descs_fts (rowid, desc) VALUES (new.rowid, new.desc);
+END;
+CREATE TRIGGER IF NOT EXISTS descs_delete AFTER DELETE ON descs BEGIN
+    INSERT INTO descs_fts (descs_fts, rowid, desc) VALUES ('delete', old.rowid, old.desc);
+END;
+"""
+
+COLUMNS = ", ".join(f"descs.{column}" for column in
+                    ["catalogue", "id", "author", "date", "price", "number_of_pages", "format", "term", "desc"])
+
+
+def connect(path):
+    """
+    Opens the index, and creates it if needed.
+    :param path: the path to the sqlite file
+    :return: a sqlite3 connection
+    """
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def date_year(date):
+    """
+    :param date: the normalised date extracted from a desc ("1836-05-12", "1836", "1795-1796"...)
+    :return: the (first) year of the date as an int, or None
+    """
+    if date is None:
+        return None
+    year = re.search("[0-9]{4}", date)
+    return int(year.group(0)) if year else None
+
+
+def update_catalogue(connection, catalogue, output_dict):
+    """
+    Replaces the descs of a catalogue with the items of output_dict.
+    :param connection: the connection to the index
+    :param catalogue: the name of the catalogue ("CAT_XXXXXX")
+    :param output_dict: the data extracted from the catalogue, by xml:id (see extractor_xml.tag_file())
+    """
+    rows = []
+    for id, values in output_dict.items():
+        # the number of pages is a message when the length could not be read
+        pages = values["number_of_pages"]
+        if not isinstance(pages, (int, float)):
+            pages = None
+        # the surnames are normalised as in the author index
+        author = author_index.normalise_surname(values["author"]) if values["author"] is not None else None
+        rows.append((catalogue, id, author, values["desc"], values["date"], date_year(values["date"]),
+                     values["price"], pages, values["format"], values["term"]))
+    with connection:
+        connection.execute("DELETE FROM descs WHERE catalogue = ?", (catalogue,))
+        connection.executemany("INSERT INTO descs (catalogue, id, author, desc, date, year, price, number_of_pages, "
+                               "format, term) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def search(connection, text=None, author=None, year_from=None, year_to=None, min_price=None, max_price=None,
+           term=None, format=None, limit=None):
+    """
+    Searches the descs. All the parameters are optional and combined.
+    :param connection: the connection to the index
+    :param text: a FTS5 query on the text of the desc (e.g. '"L. a. s."' for a phrase)
+    :param author: the surname of the author, as extracted by desc_extractor() (case insensitive)
+    :param year_from: the first year of the date of the manuscript
+    :param year_to: the last year of the date of the manuscript
+    :param min_price: the minimum price
+    :param max_price: the maximum price
+    :param term: the code of the term in the document_type taxonomy (e.g. "7" for "Lettre autographe signée")
+    :param format: the code of the format in the format taxonomy (e.g. "8" for "In-octavo")
+    :param limit: the maximum number of results
+    :return: the list of the (catalogue, id, author, date, price, number_of_pages, format, term, desc) rows
+    """
+    conditions, parameters = [], []
+    filters = [("descs_fts MATCH ?", text), ("author = ? COLLATE NOCASE", author), ("year >= ?", year_from),
+               ("year <= ?", year_to), ("price >= ?", min_price), ("price <= ?", max_price),
+               ("term = ?", term), ("format = ?", format)]
+    for condition, value in filters:
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(value)
+    query = f"SELECT {COLUMNS} FROM descs"
+    if text is not None:
+        query += " JOIN descs_fts ON descs_fts.rowid = descs.rowid"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY catalogue, descs.rowid"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+    return connection.execute(query, parameters).fetchall()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("index", help="path to the sqlite file built with extractor_xml.py --search-index")
+    arg_parser.add_argument("text", nargs="?", help="FTS5 query on the desc, e.g. '\"L. a. s.\"' for a phrase")
+    arg_parser.add_argument("--author", help="surname of the author")
+    arg_parser.add_argument("--from", dest="year_from", type=int, help="first year of the date")
+    arg_parser.add_argument("--to", dest="year_to", type=int, help="last year of the date")
+    arg_parser.add_argument("--min-price", type=float, help="minimum price")
+    arg_parser.add_argument("--max-price", type=float, help="maximum price")
+    arg_parser.add_argument("--term", help="code of the term (document_type taxonomy)")
+    arg_parser.add_argument("--format", help="code of the format (format taxonomy)")
+    arg_parser.add_argument("--limit", type=int, help="maximum number of results")
+    args = arg_parser.parse_args()
+
+    index_connection = connect(args.index)
+    results = search(index_connection, args.text, author=args.author, year_from=args.year_from,
+                     year_to=args.year_to, min_price=args.min_price, max_price=args.max_price, term=args.term,
+                     format=args.format, limit=args.limit)
+    for row in results:
+        print("\t".join("" if value is None else str(value) for value in row))
+    print(f"{len(results)} descs")
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Cache of the results of the extractor stages (see extractor_xml.stages), used to re-run only some of the
+# stages (--stages term,format).
+# There is a JSON file for each catalogue: for each stage and each xml:id, a digest of the inputs of the stage,
+# the text of the desc once tagged by the stage and the values of output_dict written by the stage.
+# A stage that is not selected reuses its results when the digest of its inputs did not change ; otherwise
+# (e.g. the desc was tagged differently by a stage that was re-run), it is run again.
+# The cache is opt-in (--stage-cache, or --stages), and a cache file is only rewritten when its content changed.
+# -----------------------------------------------------------
+
+import hashlib
+import json
+import os
+
+import atomic_file
+
+
+def cache_path(cache_dir, xml_file, output_dir):
+    """
+    :param cache_dir: the directory of the cache
+    :param xml_file: the path to a "*_clean.xml" file, compressed or not
+    :param output_dir: its output directory ("output/INPUT-DIR_tagged")
+    :return: the path to the cache of the catalogue: "cache_dir/INPUT-DIR_tagged/CAT_XXXXXX.json"
+    """
+    name = os.path.basename(xml_file).split("_clean")[0] + ".json"
+    return os.path.join(cache_dir, os.path.basename(output_dir), name)
+
+
+def digest(values):
+    """
+    :param values: the inputs of a stage for an item (JSON-serializable values)
+    :return: a short digest of the inputs
+    """
+    return hashlib.blake2b(json.dumps(values, ensure_ascii=False).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load(path):
+    """
+    :param path: the path to the cache of a catalogue
+    :return: the cache, a dict with the names of the stages as keys ; empty if there is no (readable) cache
+    """
+    try:
+        with open(path, "r") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save(path, cache):
+    """
+    Writes the cache of a catalogue (see atomic_file.py), unless the file already has the same content.
+    :param path: the path to the cache of a catalogue
+    :param cache: the cache, as updated by extractor_xml.run_extractors()
+    :return: True if the file was written, False if it did not change
+    """
+    text = json.dumps(cache, ensure_ascii=False)
+    try:
+        with open(path, "r") as cache_file:
+            if cache_file.read() == text:
+                return False
+    except OSError:
+        pass
+    with atomic_file.atomic_open(path) as cache_file:
+        cache_file.write(text)
+    return True
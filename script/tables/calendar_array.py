@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Binary version of corresp_table.json, the correspondence between the republican and the gregorian calendars.
+# The table is an array of little-endian int32 (corresp_table.bin) indexed by [year][month][day]:
+# - year: 0 for the year II to 12 for the year XIV
+# - month: 0 for vendémiaire to 11 for fructidor, 12 for the complementary days
+# - day: 0 to 29
+# Each value is the gregorian date as a proleptic ordinal (datetime.date.toordinal()), or 0 if the date does
+# not exist. The file is memory-mapped, so loading it costs nothing, even in short-lived processes ; it can
+# also be read with numpy.frombuffer(data, dtype="<i4").reshape(YEARS, MONTHS, DAYS).
+# convert_many() converts whole sequences of dates in one call (e.g. all the republican dates of a catalogue).
+# To rebuild corresp_table.bin after a change of corresp_table.json (from the folder script):
+# python3 -m tables.calendar_array
+# -----------------------------------------------------------
+
+import datetime
+import json
+import mmap
+import os
+import sys
+from array import array
+
+from .conversion_tables import republican_months, complementary_days
+
+FIRST_YEAR = 2
+YEARS = 13
+MONTHS = len(republican_months) + 1
+DAYS = 30
+
+actual_path = os.path.dirname(os.path.abspath(__file__))
+json_table = os.path.join(actual_path, "corresp_table.json")
+binary_table = os.path.join(actual_path, "corresp_table.bin")
+
+
+def build_slots():
+    """
+    Builds the position of each day of the republican year in the array, from the keys of corresp_table.json
+    ("1 vendémiaire", ..., "30 fructidor", "Vertu", ..., "6ème jour complémentaire").
+    :return: a dict with the keys of corresp_table.json as keys, and (month, day) indexes as values
+    """
+    slots = {}
+    for month, month_name in enumerate(republican_months):
+        for day in range(DAYS):
+            slots[f"{day + 1} {month_name}"] = (month, day)
+    for day, day_name in enumerate(complementary_days):
+        slots[day_name] = (len(republican_months), day)
+    return slots
+
+
+slots = build_slots()
+# the years as they are written in the keys of corresp_table.json
+years = {str(year): year - FIRST_YEAR for year in range(FIRST_YEAR, FIRST_YEAR + YEARS)}
+_table = None
+
+
+def compile_table(source=json_table, destination=binary_table):
+    """
+    Compiles corresp_table.json into the binary array.
+    :param source: the path to the json table
+    :param destination: the path to the binary table
+    """
+    with open(source, "r") as json_file:
+        correspondences = json.load(json_file)
+    ordinals = array("i", [0] * (YEARS * MONTHS * DAYS))
+    for day_and_month, dates in correspondences.items():
+        month, day = slots[day_and_month]
+        for year, date in dates.items():
+            if date != "none":
+                ordinals[index(years[year], month, day)] = datetime.date.fromisoformat(date).toordinal()
+    if sys.byteorder == "big":
+        ordinals.byteswap()
+    with open(destination, "wb") as binary_file:
+        ordinals.tofile(binary_file)
+
+
+def table():
+    """
+    :return: the binary table, memory-mapped, as a flat sequence of int
+    """
+    global _table
+    if _table is None:
+        with open(binary_table, "rb") as binary_file:
+            mapped = mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if sys.byteorder == "big":
+            _table = array("i", mapped)
+            _table.byteswap()
+        else:
+            _table = memoryview(mapped).cast("i")
+    return _table
+
+
+def index(year, month, day):
+    """
+    :return: the position of a date in the flat table, from its year, month and day indexes
+    """
+    return (year * MONTHS + month) * DAYS + day
+
+
+def lookup(day_and_month, year):
+    """
+    Converts a date with the keys of corresp_table.json.
+    :param day_and_month: a key like "1 vendémiaire" or "Vertu"
+    :param year: the year as a string of arabic numbers ("2" to "14")
+    :return: the gregorian date ("YYYY-MM-DD"), or "none" if the date does not exist
+    """
+    if day_and_month not in slots or year not in years:
+        return "none"
+    ordinal = table()[index(years[year], *slots[day_and_month])]
+    if ordinal == 0:
+        return "none"
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+
+def convert_many(year_list, month_list, day_list):
+    """
+    Converts whole sequences of republican dates in one call.
+    :param year_list: the years (2 for the year II to 14 for the year XIV)
+    :param month_list: the months (1 for vendémiaire to 12 for fructidor, 13 for the complementary days)
+    :param day_list: the days (1 to 30)
+    :return: the list of the gregorian dates ("YYYY-MM-DD"), None for the dates that do not exist
+    """
+    ordinals = table()
+    dates = []
+    for year, month, day in zip(year_list, month_list, day_list):
+        year, month, day = year - FIRST_YEAR, month - 1, day - 1
+        if 0 <= year < YEARS and 0 <= month < MONTHS and 0 <= day < DAYS and ordinals[index(year, month, day)]:
+            dates.append(datetime.date.fromordinal(ordinals[index(year, month, day)]).isoformat())
+        else:
+            dates.append(None)
+    return dates
+
+
+if __name__ == "__main__":
+    compile_table()
+    print(f"{binary_table} written")
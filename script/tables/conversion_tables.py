@@ -26,6 +26,29 @@ roman_to_arabic = {
     "XXXIII": 33
 }
 
+
+def roman_numerals(maximum):
+    """
+    Builds a table of all the roman numerals from 1 to maximum
+    :param maximum: the highest number of the table
+    :return: a dict with the roman numerals as keys and their value as values
+    """
+    symbols = [(10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+    table = {}
+    for number in range(1, maximum + 1):
+        remainder, numeral = number, ""
+        for value, symbol in symbols:
+            while remainder >= value:
+                numeral += symbol
+                remainder -= value
+        table[numeral] = number
+    return table
+
+
+# all the roman numerals that can be written with I, V and X (the lengths of the manuscripts)
+page_numerals = roman_numerals(39)
+
+
 year_range = {
     "1": "1792-1793",
     "2": "1793-1794",
@@ -68,6 +91,56 @@ abbreviations = {
     "vent": "ventôse",
 }
 
+# the names of the months of the gregorian calendar, and their abbreviations
+french_months = {
+    "janvier": 1,
+    "janv": 1,
+    "février": 2,
+    "févr": 2,
+    "fév": 2,
+    "mars": 3,
+    "avril": 4,
+    "avr": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7,
+    "juil": 7,
+    "août": 8,
+    "septembre": 9,
+    "sept": 9,
+    "octobre": 10,
+    "oct": 10,
+    "novembre": 11,
+    "nov": 11,
+    "décembre": 12,
+    "déc": 12
+}
+
+# the months of the republican calendar, in order, and the days added after fructidor
+republican_months = [
+    "vendémiaire",
+    "brumaire",
+    "frimaire",
+    "nivôse",
+    "pluviôse",
+    "ventôse",
+    "germinal",
+    "floréal",
+    "prairial",
+    "messidor",
+    "thermidor",
+    "fructidor"
+]
+
+complementary_days = [
+    "Vertu",
+    "Génie",
+    "Travail",
+    "Opinion",
+    "Récompenses",
+    "6ème jour complémentaire"
+]
+
 term_types = {
     "Ap.a.s.": 1,
     "P.a.s.": 2,
@@ -86,6 +159,25 @@ term_types = {
     "A.s.": 15
 }
 
+# the labels of the terms in the taxonomy of the output files
+term_labels = {
+    "Ap.a.s.": "Apostille autographe signée",
+    "P.a.s.": "Pièce autographe signée",
+    "P.a.": "Pièce autographe",
+    "P.s.": "Pièce signée",
+    "Bi.a.s.": "Billet autographe signé",
+    "Bi.s.": "Billet signé",
+    "L.a.s.": "Lettre autographe signée",
+    "L.a.": "Lettre autographe",
+    "L.s.": "Lettre signée",
+    "Br.s.": "Brevet signé",
+    "Q.a.s.": "Quittance autographe signée",
+    "Q.s.": "Quittance signée",
+    "M.a.": "Manuscrit autographe",
+    "C.a.": "Chanson autographe",
+    "A.s.": "Document (?) Autographe signé"
+}
+
 format_types = {
     "in-1": 1,
     "in-2": 2,
@@ -101,5 +193,18 @@ format_types = {
     "in-64": 64
 }
 
-
-
+# the labels of the formats in the taxonomy of the output files (the oblong formats are added to it)
+format_labels = {
+    "in-1": "In-folio",
+    "in-2": "In-2°",
+    "in-3": "In-3°",
+    "in-4": "In-quarto",
+    "in-8": "In-octavo",
+    "in-12": "In-12",
+    "in-16": "In-16",
+    "in-18": "In-18",
+    "in-32": "In-32",
+    "in-40": "In-40",
+    "in-48": "In-48",
+    "in-64": "In-64"
+}
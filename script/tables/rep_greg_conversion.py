@@ -1,13 +1,6 @@
-import json
-import os
 import re
 from .conversion_tables import *
-
-corresp_table = "corresp_table.json"
-actual_path = os.path.dirname(os.path.abspath(__file__))
-file_to_open = os.path.join(actual_path, corresp_table)
-with open(file_to_open, "r") as corresp_table:
-    conversion_table = json.load(corresp_table)
+from . import calendar_array
 
 def is_int(string):
     pattern = re.compile("[0-9]{1,3}")
@@ -17,13 +10,14 @@ def is_int(string):
         return False
 
 
-def full_conversion(year, month, day):
+def date_numbers(year, month, day):
     """
-    Converts a full republican date to gregorian date
-    :param year:
-    :param month:
-    :param day:
-    :return: A string of the form "YYYY-MM-DD"
+    Converts the parts of a full republican date, as written in a desc, to numbers
+    :param year: the year, in roman or arabic numbers
+    :param month: the month, or the name of a complementary day
+    :param day: the day
+    :return: a (year, month, day) tuple, as expected by calendar_array.convert_many() ; (0, 0, 0) if the date
+    is not in the table
     """
     if is_int(year):
         reg_year = year
@@ -40,11 +34,22 @@ def full_conversion(year, month, day):
     else:
         reg_month = month
     day_and_month = "%s %s" % (reg_day, reg_month)
-    try:
-        date = conversion_table[day_and_month][str(reg_year)]
-    except:
-        date = "none"
-    return date
+    if day_and_month not in calendar_array.slots or str(reg_year) not in calendar_array.years:
+        return 0, 0, 0
+    reg_month, reg_day = calendar_array.slots[day_and_month]
+    return int(reg_year), reg_month + 1, reg_day + 1
+
+
+def full_conversion(year, month, day):
+    """
+    Converts a full republican date to gregorian date
+    :param year:
+    :param month:
+    :param day:
+    :return: A string of the form "YYYY-MM-DD"
+    """
+    date = calendar_array.convert_many(*zip(date_numbers(year, month, day)))[0]
+    return date if date is not None else "none"
 
 def partial_conversion(year):
     """
@@ -60,11 +65,14 @@ def partial_conversion(year):
     return date
 
 
-def main(desc):
+def republican_date(desc):
     """
-
+    Finds the republican date of a desc, without converting a full date (the full dates of a whole catalogue
+    are converted in one call of calendar_array.convert_many(), see extractor_xml.date_extractor())
     :param desc: The tei:desc as a string
-    :return: the formatted date the string corresponding to the date.
+    :return: a (date, date_string, numbers) tuple: for a full date, date is None and numbers is its
+    (year, month, day) tuple (see date_numbers()) ; otherwise, date is the range of years or "none", and
+    numbers is None
     """
     full_date = re.search("([0-3]{0,1}[0-9I][er]{0,2}) (.{0,13}) an ([XIVxiv]{1,4}|[0-9]{1,2})", desc)
     partial_date = re.search("an ([XIVxiv]{1,4}|[0-9]{1,2})", desc)
@@ -73,12 +81,22 @@ def main(desc):
         day = full_date.group(1)
         month = full_date.group(2)
         year = full_date.group(3).upper()
-        date = full_conversion(year, month, day)
+        return None, date_string, date_numbers(year, month, day)
     elif not full_date and partial_date:
         year = partial_date.group(1).upper()
         date_string = year
-        date = partial_conversion(year)
+        return partial_conversion(year), date_string, None
     else:
-        date = "none"
-        date_string = None
+        return "none", None, None
+
+
+def main(desc):
+    """
+
+    :param desc: The tei:desc as a string
+    :return: the formatted date the string corresponding to the date.
+    """
+    date, date_string, numbers = republican_date(desc)
+    if numbers is not None:
+        date = calendar_array.convert_many(*zip(numbers))[0] or "none"
     return date, date_string
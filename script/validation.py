@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Validation of the tagged files against a RELAX NG schema (e.g. the Katabase ODD compiled to odd_katabase.rng),
+# with --validate path/to/schema.rng.
+# The schema is compiled once in each process (see load_schema()), and each tagged tree is validated in memory
+# before it is written, so that the output files never need to be parsed again.
+# libxml2 often reports an invalid desc as an error on one of its ancestors ("Element TEI has extra content"):
+# the invalid descs are found by putting back the original descs and validating again (see invalid_descs()).
+# -----------------------------------------------------------
+
+import functools
+
+from lxml import etree
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(path):
+    """
+    :param path: the path to a RELAX NG schema
+    :return: the compiled schema (it is only compiled the first time in each process)
+    :raise etree.RelaxNGParseError, OSError: if the schema cannot be read or compiled
+    """
+    return etree.RelaxNG(etree.parse(path))
+
+
+def validation_record(id, schema, message=None):
+    """
+    Builds an entry of the error log for an invalid desc (see extractor_xml.error_record()).
+    :param id: the xml:id of the invalid desc, or None if the error is not in a tagged desc
+    :param schema: the compiled schema, whose error log holds the errors of the last validation
+    :param message: a message to put before the errors of the schema
+    :return: a dict with the file, xml:id, stage, error message and traceback (None)
+    """
+    errors = [error.message for error in schema.error_log]
+    return {"file": None, "id": id, "stage": "validate",
+            "error": "DocumentInvalid: " + " ; ".join(([message] if message else []) + errors), "traceback": None}
+
+
+def swap(elements, replacements):
+    """
+    Replaces elements of a tree (each element keeps its own tail, so that swapping them back restores the tree).
+    :param elements: the elements in the tree
+    :param replacements: the elements to put in their place
+    """
+    for element, replacement in zip(elements, replacements):
+        element.getparent().replace(element, replacement)
+
+
+def invalid_descs(schema, tree, tagged):
+    """
+    Validates a tagged tree, and finds the tagged descs that make it invalid.
+    :param schema: the compiled schema (see load_schema())
+    :param tree: the tagged tree
+    :param tagged: a list of (xml:id, original desc, tagged desc) tuples, the tagged descs being in the tree
+    :return: the entries of the error log of the invalid descs (see validation_record()) ; empty if the tree is valid
+    """
+    if schema.validate(tree):
+        return []
+    ids, originals, descs = zip(*tagged) if tagged else ((), (), ())
+    records = []
+
+    def find(positions):
+        # the tagged descs of positions are put in the tree, the other descs being the original ones
+        swap([originals[position] for position in positions], [descs[position] for position in positions])
+        valid = schema.validate(tree)
+        if not valid and len(positions) == 1:
+            records.append(validation_record(ids[positions[0]], schema))
+        swap([descs[position] for position in positions], [originals[position] for position in positions])
+        if not valid and len(positions) > 1:
+            find(positions[:len(positions) // 2])
+            find(positions[len(positions) // 2:])
+
+    swap(descs, originals)
+    try:
+        # with the original descs, the tree tells whether the input file was already invalid
+        if not schema.validate(tree):
+            return [validation_record(None, schema, "the input file is not valid")]
+        find(list(range(len(ids))))
+    finally:
+        swap(originals, descs)
+    if not records:
+        # the tree is only invalid with several tagged descs together
+        schema.validate(tree)
+        records.append(validation_record(None, schema))
+    return records
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# coding: utf-8
+
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Watch mode of extractor_xml.py: the input directories are monitored and every "*_clean.xml"
+# file (compressed or not, see compression.py) that is written is re-tagged into its "output/INPUT-DIR_tagged" directory.
+#
+# - changes are detected with inotify if the inotify_simple library is installed, by polling
+#   the modification times of the files otherwise
+# - writes are debounced: a file is tagged once it has not been modified for `debounce` seconds
+# - the tagging itself runs in a bounded pool of processes, driven by an asyncio event loop ;
+#   a file is never tagged twice at the same time, a change during its tagging triggers a new run
+# - as in a batch run, an item on which an extractor fails is left untagged, and the errors are appended to the
+#   error log (output/errors.jsonl) ; the tagged files are validated (--validate), the stage cache is used
+#   (--stage-cache, --stages) and the indexes are updated (--author-index, --search-index) as in a batch run
+# -----------------------------------------------------------
+
+import asyncio
+import fnmatch
+import functools
+import glob
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import author_index
+import compression
+import extractor_xml
+import search_index
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+def watch(input_dirs, root, workers=None, debounce=2.0, interval=1.0, compress=None, error_log=None, schema=None,
+          cache_dir=None, selected=None, author_index_path=None, search_index_path=None):
+    """
+    Watches the input directories until the process is interrupted.
+    :param input_dirs: the input directories, as given in the command line
+    :param root: the root directory of the repository (the tagged files are written in root/output)
+    :param workers: the maximum number of files tagged at the same time
+    :param debounce: the number of seconds without writes after which a file is tagged
+    :param interval: the number of seconds between two scans when inotify is not available
+    :param compress: None, or the compression of the tagged files ("gzip" or "zstd")
+    :param error_log: None, or the JSON Lines file to which the errors are appended (see
+    extractor_xml.error_record())
+    :param schema: None, or the path to a RELAX NG schema against which the tagged files are validated
+    :param cache_dir: None, or the directory of the stage cache (see stage_cache.py)
+    :param selected: None to run all the stages, or the names of the stages to run (see extractor_xml.run_extractors())
+    :param author_index_path: None, or the path to the author index to update (see author_index.py)
+    :param search_index_path: None, or the path to the search index to update (see search_index.py)
+    """
+    catalogue_watcher = CatalogueWatcher(input_dirs, root, workers, debounce, interval, compress, error_log, schema,
+                                         cache_dir, selected, author_index_path, search_index_path)
+    try:
+        asyncio.run(catalogue_watcher.run())
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+class CatalogueWatcher:
+    """
+    Detects the changes in the input directories and schedules the tagging of the changed files.
+    """
+    def __init__(self, input_dirs, root, workers, debounce, interval, compress=None, error_log=None, schema=None,
+                 cache_dir=None, selected=None, author_index_path=None, search_index_path=None):
+        self.output_dirs = {os.path.abspath(input_dir): extractor_xml.output_directory(input_dir, root)
+                            for input_dir in input_dirs}
+        self.workers = workers
+        self.debounce = debounce
+        self.interval = interval
+        self.compress = compress
+        self.error_log = error_log
+        self.tag_task = functools.partial(extractor_xml.tag_task, progress=None, cache_dir=cache_dir,
+                                          selected=selected, compress=compress, schema=schema)
+        # the indexes are opened by run(), in the thread of the event loop
+        self.index_paths = {author_index: author_index_path, search_index: search_index_path}
+        self.indexes = {}
+        self.timers = {}  # path -> pending debounce timer
+        self.running = set()  # paths being tagged
+        self.dirty = set()  # paths modified while being tagged
+        self.loop = None
+        self.pool = None
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        for output_dir in self.output_dirs.values():
+            os.makedirs(output_dir, exist_ok=True)
+        self.indexes = {index: index.connect(path) for index, path in self.index_paths.items() if path is not None}
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as self.pool:
+                print(f"Watching {', '.join(self.output_dirs)} (Ctrl+C to stop)")
+                if inotify_simple is not None:
+                    await self.watch_inotify()
+                else:
+                    await self.watch_polling()
+        finally:
+            for connection in self.indexes.values():
+                connection.close()
+
+    async def watch_inotify(self):
+        """
+        Registers the input directories to inotify and reads its events as they come.
+        """
+        inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO
+        watched = {inotify.add_watch(input_dir, flags): input_dir for input_dir in self.output_dirs}
+
+        def read_events():
+            for event in inotify.read(timeout=0):
+                if any(fnmatch.fnmatch(event.name, pattern) for pattern in compression.INPUT_PATTERNS):
+                    self.changed(os.path.join(watched[event.wd], event.name))
+
+        self.loop.add_reader(inotify.fileno(), read_events)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.loop.remove_reader(inotify.fileno())
+            inotify.close()
+
+    async def watch_polling(self):
+        """
+        Scans the input directories every `interval` seconds and compares the modification times and sizes.
+        """
+        snapshot = self.scan()
+        while True:
+            await asyncio.sleep(self.interval)
+            new_snapshot = self.scan()
+            for path, stat in new_snapshot.items():
+                if snapshot.get(path) != stat:
+                    self.changed(path)
+            snapshot = new_snapshot
+
+    def scan(self):
+        """
+        :return: a dict with the paths of the watched files as keys, and their (mtime, size) as values
+        """
+        snapshot = {}
+        for input_dir in self.output_dirs:
+            for pattern in compression.INPUT_PATTERNS:
+                for path in glob.iglob(os.path.join(input_dir, pattern)):
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def changed(self, path):
+        """
+        (Re)starts the debounce timer of a modified file.
+        """
+        if path in self.timers:
+            self.timers[path].cancel()
+        self.timers[path] = self.loop.call_later(self.debounce, self.submit, path)
+
+    def submit(self, path):
+        """
+        Schedules the tagging of a file, unless it is already being tagged.
+        """
+        self.timers.pop(path, None)
+        if path in self.running:
+            self.dirty.add(path)
+        else:
+            self.running.add(path)
+            self.loop.create_task(self.retag(path))
+
+    async def retag(self, path):
+        """
+        Tags a file in the process pool and reports the result (see extractor_xml.tag_task()).
+        """
+        output_dir = self.output_dirs[os.path.dirname(path)]
+        try:
+            output_dict, errors, _ = await self.loop.run_in_executor(self.pool, self.tag_task, path, output_dir)
+            self.log_errors(errors)
+            if output_dict is None:
+                print(f"ERROR ON FILE --- {path}")
+                print(errors[-1]["error"])
+                return
+            for index, connection in self.indexes.items():
+                index.update_catalogue(connection, extractor_xml.catalogue_name(path), output_dict)
+            if errors:
+                print(f"Tagged {path} -> {extractor_xml.tagged_path(path, output_dir, self.compress)}, "
+                      f"{len(errors)} errors, see {self.error_log}")
+            else:
+                print(f"Tagged {path} -> {extractor_xml.tagged_path(path, output_dir, self.compress)}")
+        except Exception:
+            logging.exception("Failed to tag %s", path)
+            print(f"ERROR ON FILE --- {path}")
+        finally:
+            self.running.discard(path)
+            if path in self.dirty:
+                self.dirty.discard(path)
+                self.submit(path)
+
+    def log_errors(self, errors):
+        """
+        Appends the entries of the error log of a file to the error log.
+        """
+        if self.error_log is None or not errors:
+            return
+        with open(self.error_log, "a") as error_log:
+            for error in errors:
+                error_log.write(json.dumps(error, ensure_ascii=False) + "\n")
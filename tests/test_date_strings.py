@@ -0,0 +1,35 @@
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Tests of the normalisation of the date strings (see parse_date_string() in script/extractor_xml.py).
+# -----------------------------------------------------------
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+import extractor_xml  # noqa: E402
+
+DESCS = ["Lettre aut. sig.; Paris, 12 mai 1836, 1 p.", "Pièce sig.; Paris, 12 mai 1836, 1 p.",
+         "Lettre aut. sig.; Rome, vers 1790 environ, 2 p."]
+
+
+def date_strings(descs):
+    """
+    :return: the date_strings_total metrics counted while the dates of descs are extracted
+    """
+    descList = [[desc, str(position), None, None, None] for position, desc in enumerate(descs)]
+    previous = extractor_xml.process_metrics.copy()
+    extractor_xml.date_extractor(descList, {item[1]: {} for item in descList})
+    return extractor_xml.process_metrics.since(previous).to_dict().get("date_strings_total", {})
+
+
+def test_metrics_do_not_depend_on_the_previous_catalogues():
+    first = date_strings(DESCS)
+    assert first == date_strings(DESCS)
+    assert first == {"native": 1, "dateparser": 1}
+
+
+def test_cache_is_bounded():
+    assert extractor_xml.parse_date_string.cache_info().maxsize == extractor_xml.date_cache_size
@@ -0,0 +1,27 @@
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Tests of the conversion of the republican dates (see script/tables/calendar_array.py).
+# -----------------------------------------------------------
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+import extractor_xml  # noqa: E402
+from tables import calendar_array, rep_greg_conversion  # noqa: E402
+
+
+def test_convert_many():
+    assert calendar_array.convert_many([2, 8, 2], [1, 2, 1], [1, 18, 31]) == ["1793-09-22", "1799-11-09", None]
+
+
+def test_date_extractor_converts_the_republican_dates():
+    descs = ["Lettre aut. sig.; Paris, 18 brumaire an VIII, 1 p.", "Pièce sig.; Paris, 3 nivôse an 2, 1 p.",
+             "Lettre aut. sig.; Paris, an V, 1 p."]
+    descList = [[desc, str(position), None, None, None] for position, desc in enumerate(descs)]
+    output_dict = extractor_xml.date_extractor(descList, {str(position): {} for position in range(len(descs))})
+    assert [output_dict[str(position)]["date"] for position in range(len(descs))] == \
+           [rep_greg_conversion.main(desc)[0] for desc in descs]
+    assert output_dict["0"]["date"] == "1799-11-09"
@@ -0,0 +1,33 @@
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Tests of the library entry point (tag_descs(), see script/extractor_xml.py).
+# -----------------------------------------------------------
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+import extractor_xml  # noqa: E402
+
+
+def test_results_follow_the_records():
+    records = [{"id": "a", "desc": "L. a. s.; 1836, 1 p. in-8."}, {"id": "b", "desc": "P. s.; 1790, 2 p."}]
+    results = [result for batch in extractor_xml.tag_descs(records) for result in batch]
+    assert [result["id"] for result in results] == ["a", "b"]
+    assert [result["date"] for result in results] == ["1836", "1790"]
+
+
+def test_duplicate_ids_are_rejected():
+    records = [{"id": "a", "desc": "L. a. s.; 1836, 1 p."}, {"id": "a", "desc": "P. s.; 1790, 2 p."}]
+    with pytest.raises(ValueError, match="duplicate ids"):
+        list(extractor_xml.tag_descs(records))
+
+
+def test_generated_ids_do_not_hide_a_duplicate():
+    records = ["L. a. s.; 1836, 1 p.", {"id": "desc_0", "desc": "P. s.; 1790, 2 p."}]
+    with pytest.raises(ValueError, match="desc_0"):
+        list(extractor_xml.tag_descs(records))
@@ -0,0 +1,46 @@
+# -----------------------------------------------------------
+#  Katabase project: github.com/katabase/
+# Tests of the validation of the tagged files (--validate, see script/validation.py).
+# -----------------------------------------------------------
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+import extractor_xml  # noqa: E402
+
+CATALOGUE = os.path.join(ROOT, "1-100", "CAT_000012_clean.xml")
+
+# A schema that accepts any document.
+PERMISSIVE_SCHEMA = """<grammar xmlns="http://relaxng.org/ns/structure/1.0">
+  <start><ref name="any"/></start>
+  <define name="any">
+    <element><anyName/>
+      <zeroOrMore><choice><attribute><anyName/></attribute><text/><ref name="any"/></choice></zeroOrMore>
+    </element>
+  </define>
+</grammar>
+"""
+
+
+@pytest.fixture
+def schema(tmp_path):
+    path = tmp_path / "permissive.rng"
+    path.write_text(PERMISSIVE_SCHEMA)
+    return str(path)
+
+
+def test_valid_file_without_error_list(tmp_path, schema):
+    output_dict = extractor_xml.tag_file(CATALOGUE, str(tmp_path), schema=schema)
+    assert output_dict
+    assert os.path.isfile(extractor_xml.tagged_path(CATALOGUE, str(tmp_path)))
+
+
+def test_valid_file_with_error_list(tmp_path, schema):
+    errors = []
+    extractor_xml.tag_file(CATALOGUE, str(tmp_path), errors, schema=schema)
+    assert [error for error in errors if error["stage"] == "validate"] == []